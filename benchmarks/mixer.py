@@ -0,0 +1,109 @@
+"""
+Per-frame cost of the audio mixer across many guilds.
+
+Every guild gets a MixerSource playing music with a sound effect and TTS
+over it, so each frame mixes three layers and ramps the ducked music.
+One tick reads a frame from every guild's mixer, the way their players
+do every 20 ms.
+
+Usage:
+
+    python -m benchmarks.mixer --guilds 1,10,100 --ticks 500
+"""
+import argparse
+import statistics
+import time
+
+import discord
+import numpy as np
+
+from src.music.mixer import FRAME_SIZE, MixerSource
+
+FRAME_BUDGET_MS = discord.opus.Encoder.FRAME_LENGTH
+
+
+def read_command_line():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument(
+        "--guilds",
+        type=str,
+        default="1,10,100",
+        help="Comma separated amounts of guilds mixing at once"
+    )
+
+    parser.add_argument(
+        "--ticks",
+        type=int,
+        default=500,
+        help="Frames to mix per guild"
+    )
+
+    return parser.parse_args()
+
+
+class LoopingPCM(discord.AudioSource):
+    """A tone that never ends, read straight from memory."""
+
+    def __init__(self, frequency):
+        t = np.arange(FRAME_SIZE // 4 * 50) / 48000
+        tone = (np.sin(2 * np.pi * frequency * t) * 8000).astype(np.int16)
+        self.pcm = np.repeat(tone, 2).tobytes()
+        self.position = 0
+
+    def read(self):
+        if self.position >= len(self.pcm):
+            self.position = 0
+        frame = self.pcm[self.position:self.position + FRAME_SIZE]
+        self.position += FRAME_SIZE
+        return frame
+
+
+def run(guilds, ticks):
+    mixers = []
+    for _ in range(guilds):
+        mixer = MixerSource()
+        mixer.set_layer("music", LoopingPCM(220))
+        mixer.set_layer("sfx", LoopingPCM(660))
+        mixer.set_layer("tts", LoopingPCM(440))
+        mixers.append(mixer)
+
+    tick_times = []
+    for tick in range(ticks):
+        if tick % 50 == 0:
+            # Toggle the TTS so the music ramps down and up again
+            for mixer in mixers:
+                if mixer.get_source("tts"):
+                    mixer.clear_layer("tts")
+                else:
+                    mixer.set_layer("tts", LoopingPCM(440))
+
+        start = time.perf_counter()
+        for mixer in mixers:
+            mixer.read()
+        tick_times.append(time.perf_counter() - start)
+
+    return {
+        "tick_ms": statistics.mean(tick_times) * 1000,
+        "tick_p95_ms": sorted(tick_times)[int(0.95 * (len(tick_times) - 1))] * 1000,
+        "frame_us": statistics.mean(tick_times) / guilds * 1e6,
+    }
+
+
+def main():
+    args = read_command_line()
+
+    print(f"3 layers per guild, {FRAME_BUDGET_MS} ms per frame")
+    print(f"{'guilds':>6} {'tick ms':>8} {'tick p95':>9} {'us/frame':>9} {'budget':>7}")
+    for guilds in args.guilds.split(","):
+        result = run(int(guilds), args.ticks)
+        budget = result["tick_p95_ms"] / FRAME_BUDGET_MS * 100
+        print(
+            f"{guilds:>6} {result['tick_ms']:>8.2f} {result['tick_p95_ms']:>9.2f} "
+            f"{result['frame_us']:>9.1f} {budget:>6.1f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Time to first audio of music playback, per source type.
+
+Extracts every URL once (so yt-dlp isn't part of the timing), then starts
+ffmpeg on the stream with the default and the fast start options and
+times how long it takes to decode the first frame. This is the part of a
+`music.control start` between extraction and audio leaving the bot.
+
+Usage:
+
+    python -m benchmarks.playback_startup --runs 5 \\
+        https://www.youtube.com/watch?v=dQw4w9WgXcQ https://soundcloud.com/...
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from collections import defaultdict
+
+import discord
+
+from src.config.cliargs import CLIArgs
+from src.music.ytdl_source import ffmpeg_options, ffmpeg_options_for, get_extraction_cache, source_type
+
+
+def read_command_line():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument(
+        "urls",
+        nargs="+",
+        help="URLs or searches to play"
+    )
+
+    parser.add_argument(
+        "--runs",
+        type=int,
+        default=5,
+        help="Playback starts to time per URL and mode"
+    )
+
+    return parser.parse_args()
+
+
+def time_first_frame(url, options):
+    start = time.perf_counter()
+    audio = discord.FFmpegPCMAudio(url, **options)
+    try:
+        if not audio.read():
+            return None
+        return time.perf_counter() - start
+    finally:
+        audio.cleanup()
+
+
+async def run(urls, runs):
+    loop = asyncio.get_event_loop()
+    results = defaultdict(list)
+    for url in urls:
+        data = await get_extraction_cache().extract_info(url, loop=loop)
+        if 'entries' in data:
+            data = data['entries'][0]
+
+        modes = {"default": ffmpeg_options, "fast": ffmpeg_options_for(data)}
+        for _ in range(runs):
+            for mode, options in modes.items():
+                elapsed = await loop.run_in_executor(None, time_first_frame, data['url'], options)
+                if elapsed is not None:
+                    results[(source_type(data), mode)].append(elapsed)
+
+    return results
+
+
+def main():
+    args = read_command_line()
+    CLIArgs.fast_start = True
+
+    results = asyncio.run(run(args.urls, args.runs))
+
+    print(f"{'source':<24} {'mode':<8} {'runs':>5} {'p50 ms':>8} {'p95 ms':>8}")
+    for (kind, mode), times in sorted(results.items()):
+        times = sorted(times)
+        p95 = times[int(0.95 * (len(times) - 1))]
+        print(
+            f"{kind:<24} {mode:<8} {len(times):>5} "
+            f"{statistics.median(times) * 1000:>8.0f} {p95 * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
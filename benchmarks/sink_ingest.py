@@ -0,0 +1,129 @@
+"""
+Micro-benchmark of the WhisperSink ingest path.
+
+Simulates a guild with a growing amount of simultaneous speakers. Each tick
+every speaker writes 100 ms of 20 ms packets, the way the discord decoder
+thread does, and the voice thread drains them into the speaker buffers.
+Inference is never scheduled, only write and drain are timed.
+
+Usage:
+
+    python -m benchmarks.sink_ingest --speakers 1,5,10,20 --ticks 200
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from src.bot.sinks.whisper_sink import WhisperSink
+from src.transcription.scheduler import InferenceScheduler
+
+SAMPLING_RATE = 48000
+CHANNELS = 2
+PACKET_SAMPLES = SAMPLING_RATE // 50
+PACKETS_PER_TICK = 5
+
+
+def read_command_line():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument(
+        "--speakers",
+        type=str,
+        default="1,2,5,10,20",
+        help="Comma separated amounts of simultaneous speakers"
+    )
+
+    parser.add_argument(
+        "--ticks",
+        type=int,
+        default=200,
+        help="Voice thread ticks to simulate per run"
+    )
+
+    parser.add_argument(
+        "--silero",
+        action="store_true",
+        help="Confirm speech with Silero, by default only the energy gate runs"
+    )
+
+    return parser.parse_args()
+
+
+def fake_voice_client():
+    decoder = SimpleNamespace(
+        SAMPLING_RATE=SAMPLING_RATE,
+        CHANNELS=CHANNELS,
+        SAMPLE_SIZE=2 * CHANNELS,
+    )
+    return SimpleNamespace(decoder=decoder, channel=SimpleNamespace(guild=SimpleNamespace(id=0)))
+
+
+def make_packets(count):
+    # A loud tone for speech, so the VAD keeps the audio
+    t = np.arange(PACKET_SAMPLES * count) / SAMPLING_RATE
+    tone = (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16)
+    pcm = np.repeat(tone, CHANNELS).tobytes()
+    size = PACKET_SAMPLES * 2 * CHANNELS
+    return [pcm[i * size:(i + 1) * size] for i in range(count)]
+
+
+def run(speakers, ticks, silero):
+    sink = WhisperSink(
+        asyncio.Queue(),
+        None,
+        max_speakers=-1,
+        vad_silero_threshold=0.5 if silero else None,
+        # Never started, nothing is decoded
+        scheduler=InferenceScheduler(),
+    )
+    sink.init(fake_voice_client())
+
+    packets = make_packets(PACKETS_PER_TICK)
+    write_times = []
+    drain_times = []
+    for _ in range(ticks):
+        start = time.perf_counter()
+        for packet in packets:
+            for user in range(speakers):
+                sink.write(packet, user)
+        write_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        sink.drain_voice_packets()
+        drain_times.append(time.perf_counter() - start)
+
+        # Keep the buffers at a realistic size
+        for speaker in sink.speakers.values():
+            speaker.new_bytes = 0
+            speaker.data = speaker.data[-50:]
+            speaker.utterance = speaker.utterance[-50:]
+
+    packets_per_tick = speakers * PACKETS_PER_TICK
+    return {
+        "write_us": statistics.mean(write_times) / packets_per_tick * 1e6,
+        "drain_ms": statistics.mean(drain_times) * 1000,
+        "drain_p95_ms": sorted(drain_times)[int(0.95 * (len(drain_times) - 1))] * 1000,
+        "drain_us": statistics.mean(drain_times) / packets_per_tick * 1e6,
+    }
+
+
+def main():
+    args = read_command_line()
+
+    print(f"{PACKETS_PER_TICK} packets per speaker per tick, the voice thread has 100 ms per tick")
+    print(f"{'speakers':>8} {'write us/pkt':>13} {'drain ms':>9} {'drain p95':>10} {'drain us/pkt':>13}")
+    for speakers in args.speakers.split(","):
+        result = run(int(speakers), args.ticks, args.silero)
+        print(
+            f"{speakers:>8} {result['write_us']:>13.2f} {result['drain_ms']:>9.2f} "
+            f"{result['drain_p95_ms']:>10.2f} {result['drain_us']:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Accuracy/latency matrix for the whisper settings.
+
+Runs a corpus of wake word utterances through every combination of model,
+compute type and thread count and reports the real-time factor, p50/p95
+latency, word error rate and how often the wake word survived.
+
+The corpus is a directory with a `manifest.json`:
+
+    [{"audio": "hey_billy_play_jazz.wav", "text": "Hey Billy, play some jazz."}, ...]
+
+`benchmarks/fixtures/wake_words` has a manifest to record a corpus with,
+see its README.
+
+Usage:
+
+    python -m benchmarks.transcription --corpus benchmarks/fixtures/wake_words \\
+        --models base.en,medium.en --compute-types int8,int8_float32,float32
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from faster_whisper import decode_audio
+
+from src.transcription.audio import SAMPLING_RATE
+from src.transcription.models import load_model, profile_options
+from src.utils.strings import WAKE_WORDS, find_wake_word_start, word_error_rate
+
+
+def read_command_line():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+
+    parser.add_argument(
+        "--corpus",
+        type=str,
+        default=os.path.join(os.path.dirname(__file__), "fixtures", "wake_words"),
+        help="Directory holding manifest.json and the audio it lists"
+    )
+
+    parser.add_argument(
+        "--models",
+        type=str,
+        default="base.en,small.en,medium.en",
+        help="Comma separated whisper models"
+    )
+
+    parser.add_argument(
+        "--compute-types",
+        type=str,
+        default="int8,int8_float32,float32",
+        help="Comma separated CTranslate2 compute types"
+    )
+
+    parser.add_argument(
+        "--cpu-threads",
+        type=str,
+        default="0",
+        help="Comma separated thread counts, 0 lets CTranslate2 decide"
+    )
+
+    parser.add_argument(
+        "--profile",
+        type=str,
+        default="final",
+        help="Decoding profile whose options are used"
+    )
+
+    return parser.parse_args()
+
+
+def load_corpus(path):
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+
+    missing = [entry["audio"] for entry in manifest if not os.path.exists(os.path.join(path, entry["audio"]))]
+    if missing:
+        raise SystemExit(
+            f"{len(missing)} recordings of the corpus in {path} are missing, e.g. {missing[0]}. "
+            f"See benchmarks/fixtures/wake_words/README.md to record them.")
+
+    return [
+        (decode_audio(os.path.join(path, entry["audio"]), sampling_rate=SAMPLING_RATE), entry["text"])
+        for entry in manifest
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+def run(model, corpus, options):
+    latencies = []
+    errors = []
+    wake_hits = 0
+    for audio, text in corpus:
+        start = time.perf_counter()
+        segments, info = model.transcribe(audio, **options)
+        hypothesis = "".join(segment.text for segment in segments)
+        latencies.append(time.perf_counter() - start)
+
+        errors.append(word_error_rate(text, hypothesis))
+        if find_wake_word_start(WAKE_WORDS, hypothesis) != -1:
+            wake_hits += 1
+
+    audio_seconds = sum(len(audio) for audio, _ in corpus) / SAMPLING_RATE
+    return {
+        "rtf": sum(latencies) / audio_seconds,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "wer": statistics.mean(errors),
+        "wake": wake_hits / len(corpus),
+    }
+
+
+def main():
+    args = read_command_line()
+    corpus = load_corpus(args.corpus)
+    options = profile_options(args.profile)
+
+    print(f"{len(corpus)} utterances, profile {args.profile}")
+    print(f"{'model':<12} {'compute':<14} {'threads':>7} {'RTF':>6} {'p50 ms':>8} {'p95 ms':>8} {'WER':>6} {'wake':>6}")
+
+    for name in args.models.split(","):
+        for compute_type in args.compute_types.split(","):
+            for cpu_threads in args.cpu_threads.split(","):
+                model = load_model(name, compute_type=compute_type,
+                                   cpu_threads=int(cpu_threads), num_workers=1)
+                # Warm up so model loading isn't part of the first latency
+                run(model, corpus[:1], options)
+
+                result = run(model, corpus, options)
+                print(
+                    f"{name:<12} {compute_type:<14} {cpu_threads:>7} {result['rtf']:>6.3f} "
+                    f"{result['p50'] * 1000:>8.0f} {result['p95'] * 1000:>8.0f} "
+                    f"{result['wer']:>6.1%} {result['wake']:>6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -48,6 +48,10 @@ if __name__ == "__main__":
 
     from src.bot.heybilly_bot import HeyBillyBot
     from src.database.supabase import supabase
+    from src.transcription.scheduler import get_inference_scheduler
+
+    # Load the whisper models up front so the first transcript isn't slow
+    get_inference_scheduler()
 
     bot = HeyBillyBot(supabase, loop)
 
@@ -91,12 +95,18 @@ if __name__ == "__main__":
             helper = bot.guild_to_helper.get(guild_id, BotHelper(bot))
             helper.guild_id = guild_id
             helper.set_vc(vc)
+            try:
+                settings = await bot.guild_settings.get(guild_id)
+                if settings and not helper.voice:
+                    helper.voice = settings.get("voice", None)
+            except Exception as e:
+                logger.error(f"Error loading guild settings: {e}")
             bot.guild_to_helper[guild_id] = helper
             await ctx.respond(f"Connected to {author_vc.channel.name}.", ephemeral=True)
         except Exception as e:
             await ctx.respond(f"{e}", ephemeral=True)
 
-        bot.start_recording(ctx)
+        await bot.start_recording(ctx)
 
     @bot.slash_command(name="disconnect", description="Disconnect from your voice channel.")
     async def disconnect(ctx: discord.context.ApplicationContext):
@@ -185,10 +195,9 @@ if __name__ == "__main__":
 
     @bot.slash_command(name="voice_get", description="Get the current voice used for TTS.")
     async def voice_get(ctx: discord.context.ApplicationContext):
-        res = bot.supabase.from_('guild_settings').select(
-            'voice').eq('guild_id', ctx.guild_id).execute()
+        settings = await bot.guild_settings.get(ctx.guild_id)
 
-        stored_voice = res.data[0].get('voice', None)
+        stored_voice = settings.get('voice', None) if settings else None
         if stored_voice:
             await ctx.respond(f"Current voice: {get_voice_name(stored_voice)}.", ephemeral=True)
         else:
@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import time
+
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ORDERED_LANE = "ordered"
+PRIORITY_LANE = "priority"
+
+# Quick to handle and noticeable when late, they don't wait behind music or TTS
+PRIORITY_NODE_TYPES = {"volume.set"}
+
+
+def lane_for(action: dict):
+    if action.get("node_type", None) in PRIORITY_NODE_TYPES or action.get("status", None):
+        return PRIORITY_LANE
+    return ORDERED_LANE
+
+
+class ActionLanes:
+    """
+    Runs actions per guild, so a slow action in one guild doesn't hold up another.
+
+    Every guild gets an ordered lane and a priority lane, each a queue with a
+    worker task that handles its actions one at a time in arrival order.
+    Lanes are created with their first action and torn down after
+    `idle_timeout` seconds without one.
+
+    An action's `done` future is resolved with True once it's been handled,
+    whether that succeeded or not. A guild has at most `max_in_flight`
+    actions in its lanes; more are turned away by resolving `done` with
+    False, so consumers can hand them back to the broker instead of one
+    slow guild taking up every unacked message.
+
+    :param handle: Coroutine function that handles one action
+    :param idle_timeout: Seconds a lane waits for an action before it's torn down
+    :param max_in_flight: Actions of one guild that may wait or run at once
+    """
+
+    def __init__(self, handle, loop, idle_timeout=30.0, max_in_flight=16):
+        self.handle = handle
+        self.loop = loop
+        self.idle_timeout = idle_timeout
+        self.max_in_flight = max_in_flight
+        # (guild id, lane) -> asyncio.Queue of (action, done, enqueued at)
+        self.lanes = {}
+        # guild id -> actions in its lanes
+        self.in_flight = {}
+
+    def submit(self, action: dict, done=None):
+        guild_id = action.get("guild_id", None)
+        key = (guild_id, lane_for(action))
+        in_flight = self.in_flight.get(guild_id, 0)
+        if in_flight >= self.max_in_flight:
+            metrics.increment("actions.deferred")
+            if done is not None and not done.done():
+                done.set_result(False)
+            return
+
+        queue = self.lanes.get(key, None)
+        if queue is None:
+            queue = asyncio.Queue()
+            self.lanes[key] = queue
+            self.loop.create_task(self._run_lane(key, queue))
+            metrics.set_gauge("actions.lanes", len(self.lanes))
+
+        self.in_flight[guild_id] = in_flight + 1
+        queue.put_nowait((action, done, time.perf_counter()))
+        metrics.observe(f"actions.{key[1]}.depth", queue.qsize())
+
+    def _finish(self, guild_id):
+        in_flight = self.in_flight.pop(guild_id) - 1
+        if in_flight:
+            self.in_flight[guild_id] = in_flight
+
+    async def _run_lane(self, key, queue):
+        lane = key[1]
+        while True:
+            try:
+                action, done, enqueued_at = await asyncio.wait_for(queue.get(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                # Nothing can be put in between, this doesn't await
+                if queue.empty():
+                    del self.lanes[key]
+                    metrics.set_gauge("actions.lanes", len(self.lanes))
+                    logger.debug(f"Tore down idle {lane} lane of guild {key[0]}.")
+                    return
+                continue
+
+            metrics.observe(f"actions.{lane}.wait", time.perf_counter() - enqueued_at)
+            try:
+                await self.handle(action)
+            except Exception as e:
+                logger.error(f"Error processing action: {e}")
+                logger.error(f"Action: {action}")
+            finally:
+                self._finish(key[0])
+                if done is not None and not done.done():
+                    done.set_result(True)
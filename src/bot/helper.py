@@ -2,9 +2,14 @@ import asyncio
 from base64 import b64decode
 import io
 import logging
+import time
 import discord
-from src.music.ytdl_source import YTDLSource
+from src.bot.nickname_status import NicknameStatus
+from src.config.cliargs import CLIArgs
+from src.music.mixer import MixerSource
+from src.music.ytdl_source import YTDLOpusSource, YTDLSource
 from src.music.tts_queue import TTSQueue
+from src.music.tts_stream import TTSStreams
 from src.utils.tts_voice_map import TTS_VOICE_MAP
 from supabase import Client
 
@@ -12,6 +17,12 @@ BOT_NAME = "HeyBilly 💤"
 BOT_AWAKE_NAME = "HeyBilly 💬"
 BOT_PROCESSING_NAME = "HeyBilly 💡"
 
+STATUS_NICKNAMES = {
+    "awake": BOT_AWAKE_NAME,
+    "processing": BOT_PROCESSING_NAME,
+    "completed": BOT_NAME,
+}
+
 logger = logging.getLogger(__name__)
 
 
@@ -22,17 +33,26 @@ class BotHelper:
         self.guild_id = None
 
         self.tts_queue = None
+        self.tts_streams = TTSStreams()
+        self.mixer = None
         self.current_music_source = None
         self.current_music_source_url = None
         self.current_sfx_source = None
         self.user_music_volume = 0.5
 
         self.voice = None
+        self.nickname_status = None
 
         self.vc = None
 
     def set_vc(self, voice_client):
         self.vc = voice_client
+        if self.mixer:
+            self.mixer.close()
+            self.mixer = None
+        if self.tts_queue:
+            self.tts_queue.close()
+
         if voice_client is None:
             self.tts_queue = None
             self.current_music_source = None
@@ -43,6 +63,23 @@ class BotHelper:
 
         self.tts_queue = TTSQueue(voice_client, self)
         self.current_music_source = None
+        if CLIArgs.audio_mixer and CLIArgs.music_playback_mode == "pcm":
+            self.mixer = MixerSource(duck_gain=CLIArgs.duck_gain)
+
+    def ensure_mixer_playing(self):
+        if self.vc and not self.vc.is_playing() and not self.vc.is_paused():
+            self.vc.play(self.mixer, after=self.mixer_stopped_callback)
+
+    def mixer_stopped_callback(self, error):
+        if error:
+            logger.error(f'Mixer error: {error}')
+
+        # A layer may have been added while the mixer was going idle
+        self.bot.loop.call_soon_threadsafe(self._restart_mixer)
+
+    def _restart_mixer(self):
+        if self.mixer and self.mixer.has_layers():
+            self.ensure_mixer_playing()
 
     def decrease_volume(self):
         if self.vc:
@@ -73,17 +110,46 @@ class BotHelper:
         else:
             self.current_music_source = None
 
-    async def play_youtube(self, video_url):
+    async def play_youtube(self, video_url, requested_at=None):
+        # The old song keeps playing until the new one has its first frame ready
+        if CLIArgs.music_playback_mode == "opus":
+            source = await YTDLOpusSource.from_url(
+                video_url, loop=self.bot.loop, prewarm=True,
+                volume=self.user_music_volume, requested_at=requested_at)
+        else:
+            source = await YTDLSource.from_url(
+                video_url, loop=self.bot.loop, stream=True, prewarm=True,
+                volume=self.user_music_volume, requested_at=requested_at)
+
+        if self.mixer:
+            self.current_music_source = source
+            self.current_music_source_url = video_url
+            self.mixer.set_layer(
+                "music", source, after=self.music_stopped_callback)
+            self.ensure_mixer_playing()
+            return
+
+        if self.tts_queue and self.tts_queue.is_playing_tts:
+            # Starts when the TTS is done instead of the music it paused
+            self.current_music_source = source
+            self.current_music_source_url = video_url
+            self.tts_queue.replace_paused_music(source)
+            return
+
         if self.current_music_source and self.vc.is_playing():
             self.vc.stop()
 
-        self.current_music_source = await YTDLSource.from_url(video_url, loop=self.bot.loop, stream=True)
+        self.current_music_source = source
         self.vc.play(self.current_music_source,
                      after=self.music_stopped_callback)
         self.current_music_source_url = video_url
         self.vc.source.volume = self.user_music_volume
 
     async def play_sfx(self, sfx_url, sfx_duration=5):
+        if self.mixer:
+            await self.play_sfx_mixed(sfx_url, sfx_duration)
+            return
+
         old_source = self.vc.source if self.vc.is_playing() else None
 
         if self.vc.is_playing():
@@ -100,7 +166,7 @@ class BotHelper:
                 stop_playback_after_timeout(sfx_duration))
 
         # Load and play the SFX
-        self.current_sfx_source = await YTDLSource.from_url(sfx_url, loop=self.bot.loop, stream=True)
+        self.current_sfx_source = await self.load_clip(sfx_url)
         self.vc.play(self.current_sfx_source,
                      after=lambda e: sfx_stopped_callback(e, old_source, timeout_task))
         self.vc.source.volume = self.user_music_volume
@@ -118,30 +184,109 @@ class BotHelper:
                         old_source, after=self.music_stopped_callback)
                     self.vc.source.volume = self.user_music_volume
 
+    async def play_sfx_mixed(self, sfx_url, sfx_duration=5):
+        # Plays over the music, which keeps going
+        source = await self.load_clip(sfx_url, prewarm=True)
+        source.volume = self.user_music_volume
+
+        def sfx_stopped_callback(error):
+            if error:
+                logger.error(f'SFX Player error: {error}')
+            if self.current_sfx_source is source:
+                self.current_sfx_source = None
+
+        self.current_sfx_source = source
+        self.mixer.set_layer("sfx", source, after=sfx_stopped_callback)
+        self.ensure_mixer_playing()
+
+        if sfx_duration > 0:
+            self.bot.loop.call_later(
+                sfx_duration, self.mixer.clear_layer, "sfx", source)
+
+    async def load_clip(self, url, truncate=True, prewarm=False):
+        """
+        Load a short clip, from the audio cache if it was played before.
+
+        On a miss the clip streams as usual and the frames it plays are
+        cached, so it's downloaded only once.
+
+        :param prewarm: On a miss, wait for the first frame so the clip starts without a stall
+        """
+        audio_cache = self.bot.audio_cache
+        key = audio_cache.key_for_url(url)
+        cached = audio_cache.get(key)
+        if cached:
+            logger.debug(f"Playing {url} from the audio cache.")
+            return YTDLSource(cached, data={"url": url})
+
+        source = await YTDLSource.from_url(url, loop=self.bot.loop, stream=True, prewarm=prewarm)
+        source.original = audio_cache.record(
+            key, source.original, truncate=truncate, expected_seconds=source.data.get("duration", None))
+        return source
+
     async def play_tts(self, tts_url):
-        tts_source = await YTDLSource.from_url(tts_url, loop=self.bot.loop, stream=True)
         if self.tts_queue:
-            await self.tts_queue.add_tts(tts_source)
+            # Loads while the clips queued before it play. A cut off answer
+            # is worse than a slow one, long TTS isn't cached
+            await self.tts_queue.add_tts(
+                self.load_clip(tts_url, truncate=False, prewarm=True))
 
     async def play_data(self, data):
         if self.tts_queue:
             b64decoded = b64decode(data)
-            source = discord.FFmpegPCMAudio(io.BytesIO(b64decoded), pipe=True)
+
+            audio_cache = self.bot.audio_cache
+            key = audio_cache.key_for_data(b64decoded)
+            source = audio_cache.get(key)
+            if source is None:
+                # Cached from the frames it plays, like a streamed clip
+                source = audio_cache.record(key, discord.FFmpegPCMAudio(
+                    io.BytesIO(b64decoded), pipe=True), truncate=False)
+
             await self.tts_queue.add_tts(source)
 
+    async def play_tts_chunk(self, stream_id, seq, chunk, final=False, format="pcm"):
+        """
+        Feed a chunk of streamed TTS, playback starts with the first one in.
+        """
+        if not self.tts_queue:
+            return
+
+        stream, created = self.tts_streams.open(
+            stream_id, format=format, passthrough=self.mixer is None)
+        if created:
+            await self.tts_queue.add_tts(stream)
+
+        self.tts_streams.feed(stream, seq, chunk, final)
+
     def resume_music(self) -> bool:
+        if self.mixer:
+            resumed = self.mixer.resume_layer("music")
+            if resumed:
+                self.ensure_mixer_playing()
+            return resumed
+
         if self.current_music_source and self.vc.is_paused():
             self.vc.resume()
             return True
         return False
 
     def pause_music(self) -> bool:
+        if self.mixer:
+            return self.mixer.pause_layer("music")
+
         if self.current_music_source and self.vc.is_playing():
             self.vc.pause()
             return True
         return False
 
     def stop_music(self) -> bool:
+        if self.mixer:
+            stopped = self.mixer.clear_layer("music")
+            self.current_music_source = None
+            self.current_music_source_url = None
+            return stopped
+
         if self.current_music_source and self.vc.is_playing():
             self.vc.stop()
             self.current_music_source = None
@@ -151,13 +296,9 @@ class BotHelper:
 
     def set_voice(self, new_voice_id: str):
         self.voice = new_voice_id
-        res = self.supabase.table("guild_settings").update(
-            {"voice": new_voice_id}).eq("guild_id", self.guild_id).execute()
-        if hasattr(res, "error"):
-            logger.error(f"Error setting voice: {res.error}")
-        else:
-            logger.debug(
-                f"Voice in DB set to {new_voice_id} for guild {self.guild_id}.")
+        self.bot.guild_settings.update(self.guild_id, voice=new_voice_id)
+        logger.debug(
+            f"Voice set to {new_voice_id} for guild {self.guild_id}.")
 
     async def _handle_post_node(self, node, discord_channel_id):
         await self.send_message(discord_channel_id, node["data"]["text"])
@@ -165,7 +306,12 @@ class BotHelper:
     async def _handle_tts_node(self, node):
         tts_url = node["data"].get("tts_url", None)
         tts_data = node["data"].get("tts_data", None)
-        if tts_url:
+        if "stream_id" in node["data"]:
+            data = node["data"]
+            await self.play_tts_chunk(
+                data["stream_id"], data["seq"], data["chunk"],
+                final=data["final"], format=data["format"])
+        elif tts_url:
             await self.play_tts(node["data"]["tts_url"])
         elif tts_data:
             await self.play_data(node["data"]["tts_data"])
@@ -190,11 +336,12 @@ class BotHelper:
                 return
 
     async def _handle_music_control_node(self, node):
+        requested_at = time.perf_counter()
         action = node["data"]["action"]
         action = action.lower()
 
         if action == "start":
-            await self.play_youtube(node["data"]["video_url"])
+            await self.play_youtube(node["data"]["video_url"], requested_at=requested_at)
         elif action == "stop":
             self.stop_music()
         elif action == "pause":
@@ -208,14 +355,16 @@ class BotHelper:
         if self.guild_id is None:
             return
 
-        try:
-            status = update["status"]
-            if status == "awake":
-                await self.bot.get_guild(self.guild_id).get_member(self.bot.user.id).edit(nick=BOT_AWAKE_NAME)
-            elif status == "processing":
-                await self.bot.get_guild(self.guild_id).get_member(self.bot.user.id).edit(nick=BOT_PROCESSING_NAME)
-            elif status == "completed":
-                await self.bot.get_guild(self.guild_id).get_member(self.bot.user.id).edit(nick=BOT_NAME)
-        except Exception as e:
-            logger.error(f"Error updating status: {e}")
-            logger.error(f"Data: {update}")
+        nick = STATUS_NICKNAMES.get(update["status"], None)
+        if nick is None:
+            return
+
+        if self.nickname_status is None or self.nickname_status.guild_id != self.guild_id:
+            self.nickname_status = NicknameStatus(
+                self.bot,
+                self.guild_id,
+                debounce=CLIArgs.nickname_debounce,
+                min_interval=CLIArgs.nickname_min_interval,
+            )
+
+        self.nickname_status.set(nick)
@@ -1,87 +1,122 @@
 import asyncio
-import json
 import logging
 import os
 
 import discord
 
+from src.bot.action_lanes import ActionLanes
 from src.bot.sinks.whisper_sink import WhisperSink
+from src.music.audio_cache import AudioCache
 from src.queue.connect import RabbitConnection
 from src.queue.consumer_manager import ConsumerManager
 from src.queue.transcript_publisher import TranscriptPublisher
-from src.utils.strings import find_wake_word_start
-from src.stripe.customer import StripeCustomer
-from src.database.guilds import DBGuilds
+from src.config.cliargs import CLIArgs
+from src.transcription.models import profile_model
+from src.utils.strings import WAKE_WORDS, find_wake_word_start
+from src.utils.metrics import metrics
+from src.stripe.entitlements import EntitlementCache
+from src.stripe.webhook import StripeWebhookServer
+from src.database.guild_settings import GuildSettingsStore
 
 DISCORD_CHANNEL_ID = int(os.getenv("DISCORD_CHANNEL_ID"))
 
 logger = logging.getLogger(__name__)
 
-WAKE_WORDS = ["ok billy", "yo billy", "okay billy", "hey billy"]
-
 
 class HeyBillyBot(discord.Bot):
     def __init__(self, supabase, loop):
 
         super().__init__(command_prefix="!", loop=loop,
-                         activity=discord.CustomActivity(name='Listening for "Hey Billy"'))
+                         activity=discord.CustomActivity(name='Listening for "Hey Billy"'),
+                         shard_id=CLIArgs.shard_id,
+                         shard_count=CLIArgs.shard_count)
         self.guild_to_helper = {}
-        self.action_queue = asyncio.Queue()
+        self.action_queue = asyncio.Queue(maxsize=CLIArgs.action_queue_size)
+        self.action_lanes = ActionLanes(
+            self.handle_action, loop, max_in_flight=CLIArgs.guild_actions_in_flight)
         self.guild_is_recording = {}
         self.guild_whisper_sinks = {}
         self.guild_whisper_message_tasks = {}
         self.supabase = supabase
+        self.guild_settings = GuildSettingsStore(supabase)
+        self.entitlements = EntitlementCache(
+            supabase,
+            ttl=CLIArgs.entitlement_ttl,
+            negative_ttl=CLIArgs.entitlement_negative_ttl,
+        )
+        self.stripe_webhook = None
+        self.audio_cache = AudioCache(
+            CLIArgs.audio_cache_dir,
+            max_bytes=CLIArgs.audio_cache_size_mb * 1024 * 1024,
+        )
         self._is_ready = False
 
+        # Queue name -> declare arguments and how many unacked messages it may have
         self.created_queues = {
-            "output.tts": None,
-            "volume.set": None,
-            "discord.post": None,
-            "sfx.play": None,
-            "music.control": None,
+            "output.tts": {
+                # TTS chunks arrive in bursts
+                "prefetch_count": 64,
+            },
+            "volume.set": {},
+            "discord.post": {},
+            "sfx.play": {},
+            "music.control": {},
             "request.status": {
-                "x-max-length": 10,
+                "arguments": {
+                    "x-max-length": 10,
+                },
             }
         }
 
     async def process_actions(self):
         while True:
-            try:
-                action = await self.action_queue.get()
-                node_type = action.get("node_type", None)
-                guild_id = action.get("guild_id", None)
-                logger.debug(f"Processing action: {action}")
-
-                helper = self.guild_to_helper.get(guild_id, None)
-                if helper is None:
-                    logger.error(
-                        f"Helper not found for guild {guild_id}. Skipping action.")
-                    continue
-
-                if node_type == "discord.post":
-                    await helper._handle_post_node(action, DISCORD_CHANNEL_ID)
-                elif node_type == "output.tts":
-                    await helper._handle_tts_node(action)
-                elif node_type == "volume.set":
-                    helper._handle_volume_node(action)
-                elif node_type == "sfx.play":
-                    await helper._handle_sfx_node(action)
-                elif node_type == "music.control":
-                    await helper._handle_music_control_node(action)
-                elif action.get("status", None):
-                    await helper._handle_request_status_update(action)
-                else:
-                    logger.error(f"Unknown action: {action}")
-            except Exception as e:
-                logger.error(f"Error processing action: {e}")
-                logger.error(f"Action: {action}")
+            action, done = await self.action_queue.get()
+            self.action_lanes.submit(action, done)
+
+    async def handle_action(self, action):
+        node_type = action.get("node_type", None)
+        guild_id = action.get("guild_id", None)
+        logger.debug(f"Processing action: {action}")
+
+        helper = self.guild_to_helper.get(guild_id, None)
+        if helper is None:
+            logger.error(
+                f"Helper not found for guild {guild_id}. Skipping action.")
+            return
 
-            await asyncio.sleep(0.15)
+        if node_type == "discord.post":
+            await helper._handle_post_node(action, DISCORD_CHANNEL_ID)
+        elif node_type == "output.tts":
+            await helper._handle_tts_node(action)
+        elif node_type == "volume.set":
+            helper._handle_volume_node(action)
+        elif node_type == "sfx.play":
+            await helper._handle_sfx_node(action)
+        elif node_type == "music.control":
+            await helper._handle_music_control_node(action)
+        elif action.get("status", None):
+            await helper._handle_request_status_update(action)
+        else:
+            logger.error(f"Unknown action: {action}")
 
     async def on_ready(self):
         logger.info(f"Logged in as {self.user}.")
+        if not self._is_ready:
+            try:
+                await self.guild_settings.preload([guild.id for guild in self.guilds])
+            except Exception as e:
+                logger.error(f"Error preloading guild settings: {e}")
+
+            if CLIArgs.metrics_interval:
+                self.loop.create_task(metrics.log_every(CLIArgs.metrics_interval))
+
         await self.start_consumers()
 
+        if CLIArgs.stripe_webhook_port and self.stripe_webhook is None:
+            self.stripe_webhook = StripeWebhookServer(
+                self.entitlements, port=CLIArgs.stripe_webhook_port)
+            await self.stripe_webhook.start()
+
         self.loop.create_task(self.process_actions())
         self._is_ready = True
 
@@ -102,7 +137,7 @@ class HeyBillyBot(discord.Bot):
     async def on_guild_join(self, guild: discord.Guild):
         try:
             logger.info(f"Joined guild {guild.name}.")
-            successful = DBGuilds(self.supabase).create_guild_settings(
+            successful = await self.guild_settings.create(
                 guild.owner_id, guild.id)
             if successful:
                 await self.send_welcome_message(guild)
@@ -114,12 +149,28 @@ class HeyBillyBot(discord.Bot):
     async def start_consumers(self):
         self.rabbit_conn = await RabbitConnection.connect("localhost", self.loop)
         self.consumer_manager = ConsumerManager(self.rabbit_conn, self.loop)
+        self.transcript_publisher = TranscriptPublisher(
+            self.rabbit_conn,
+            pool_size=CLIArgs.publisher_channels,
+            confirms=CLIArgs.publisher_confirms,
+        )
+        await self.transcript_publisher.setup_connection()
 
-        for queue_name, args in self.created_queues.items():
+        for queue_name, settings in self.created_queues.items():
             logger.debug(f"Creating consumer for queue: {queue_name}")
-            await self.consumer_manager.create_consumer(queue_name, self.action_queue, args)
+            await self.consumer_manager.create_consumer(
+                queue_name,
+                self.action_queue,
+                settings.get("arguments", None),
+                settings.get("prefetch_count", CLIArgs.prefetch_count),
+                shard_id=CLIArgs.shard_id,
+            )
 
     async def close_consumers(self):
+        await self.guild_settings.flush_all()
+        if self.stripe_webhook:
+            await self.stripe_webhook.stop()
+        await self.transcript_publisher.close()
         await self.consumer_manager.close()
 
     def _close_and_clean_sink_for_guild(self, guild_id: int):
@@ -132,7 +183,7 @@ class HeyBillyBot(discord.Bot):
             del self.guild_whisper_sinks[guild_id]
             whisper_sink.close()
 
-    def start_recording(self, ctx: discord.context.ApplicationContext):
+    async def start_recording(self, ctx: discord.context.ApplicationContext):
         """
         Start recording audio from the voice channel. Create a whisper sink
         and start sending transcripts to the queue.
@@ -142,7 +193,7 @@ class HeyBillyBot(discord.Bot):
         """
         try:
             logger.debug(f"Checking if guild {ctx.guild_id} is activated.")
-            has_plan = StripeCustomer.has_active_plan(ctx.guild_id)
+            has_plan = await self.entitlements.has_active_plan(ctx.guild_id)
             if not has_plan:
                 logger.warning(
                     f"No active plan for guild {ctx.guild_id}. Not starting whisper sink.")
@@ -167,7 +218,7 @@ class HeyBillyBot(discord.Bot):
 
         transcript_queue = asyncio.Queue()
         t = self.loop.create_task(transcript_process(
-            self.rabbit_conn, transcript_queue, ctx.guild_id, self))
+            self.transcript_publisher, transcript_queue, ctx.guild_id, self))
         self.guild_whisper_message_tasks[ctx.guild_id] = t
 
         whisper_sink = WhisperSink(
@@ -179,7 +230,10 @@ class HeyBillyBot(discord.Bot):
             no_data_multiplier=0.55,
             max_phrase_timeout=15,
             min_phrase_length=5,
-            max_speakers=10
+            max_speakers=10,
+            wake_words=WAKE_WORDS if profile_model("wake") else None,
+            wake_word_lookback=CLIArgs.wake_word_lookback,
+            decode_for_speech=CLIArgs.decode_for_speech
         )
 
         self.guild_to_helper[ctx.guild_id].vc.start_recording(
@@ -190,8 +244,9 @@ class HeyBillyBot(discord.Bot):
                 f"Whisper sink thread exception for guild {ctx.guild_id}. Retry in 5 seconds...\n{e}")
             self._close_and_clean_sink_for_guild(ctx.guild_id)
 
-            # retry in 5 seconds
-            self.loop.call_later(5, self.start_recording, ctx)
+            # retry in 5 seconds, this runs on the sink's thread
+            self.loop.call_soon_threadsafe(
+                self.loop.call_later, 5, lambda: self.loop.create_task(self.start_recording(ctx)))
 
         whisper_sink.start_voice_thread(on_exception=on_thread_exception)
 
@@ -227,13 +282,10 @@ class HeyBillyBot(discord.Bot):
 
 
 async def transcript_process(
-        rabbit_conn,
+        transcript_publisher: TranscriptPublisher,
         transcript_queue: asyncio.Queue,
         guild_id: int,
         bot: HeyBillyBot):
-    transcript_publisher = TranscriptPublisher(rabbit_conn)
-    await transcript_publisher.setup_connection()
-
     while True:
         try:
             response = await transcript_queue.get()
@@ -258,11 +310,11 @@ async def transcript_process(
                 logger.info(f"User {username} said: {processed_line}")
                 voice = bot.guild_to_helper[guild_id].voice
 
-                await transcript_publisher.publish_data(json.dumps({
+                await transcript_publisher.publish_data({
                     "guild_id": guild_id,
                     "username": username,
                     "text": processed_line,
                     "voice": voice
-                }))
+                })
         except Exception as e:
             logger.error(f"Error processing whisper message: {e}")
@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+
+import discord
+
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class NicknameStatus:
+    """
+    Shows a status as the bot's nickname in a guild with as few edits as possible.
+
+    Only the latest status is applied: a status replaced before it was
+    applied, or that the nickname already shows, is suppressed. An edit
+    waits `debounce` seconds for the status to settle and at least
+    `min_interval` seconds after the previous edit, so bursts of status
+    messages stay well inside discord's rate limits. py-cord retries 429s
+    itself, one that still comes through, e.g. once its retries ran out,
+    is retried after the response's Retry-After.
+
+    The `nickname.sent` and `nickname.suppressed` counters track both.
+
+    :param debounce: Seconds to wait for a newer status before editing
+    :param min_interval: Seconds between two edits at least
+    """
+
+    def __init__(self, bot, guild_id, debounce=0.25, min_interval=1.0):
+        self.bot = bot
+        self.guild_id = guild_id
+        self.debounce = debounce
+        self.min_interval = min_interval
+
+        self.desired = None
+        self.pending = False
+        self.last_edit = 0
+        self.task = None
+
+    def set(self, nick):
+        if self.pending:
+            # Replaced before it was applied
+            metrics.increment("nickname.suppressed")
+
+        self.desired = nick
+        self.pending = True
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._apply_latest())
+
+    def _member(self):
+        guild = self.bot.get_guild(self.guild_id)
+        return guild.me if guild else None
+
+    def _retry_after(self, e: discord.HTTPException):
+        """Seconds until the edit may be retried, from the headers of a 429."""
+        headers = getattr(e.response, "headers", None) or {}
+        try:
+            return float(headers.get("Retry-After", self.min_interval))
+        except ValueError:
+            return self.min_interval
+
+    async def _apply_latest(self):
+        while self.pending:
+            await asyncio.sleep(self.debounce)
+
+            wait = self.last_edit + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            nick = self.desired
+            self.pending = False
+            member = self._member()
+            if member is None or member.nick == nick:
+                metrics.increment("nickname.suppressed")
+                continue
+
+            try:
+                self.last_edit = time.monotonic()
+                await member.edit(nick=nick)
+                metrics.increment("nickname.sent")
+            except discord.HTTPException as e:
+                if e.status == 429 and not self.pending:
+                    # Try again once the bucket allows it, unless a newer status came in
+                    self.last_edit = time.monotonic() + self._retry_after(e)
+                    self.pending = True
+                    continue
+                logger.error(f"Error updating status of guild {self.guild_id}: {e}")
@@ -0,0 +1,42 @@
+import struct
+
+from discord.opus import Decoder
+
+from src.transcription.audio import SAMPLING_RATE
+
+
+class SpeechDecoder(Decoder):
+    """
+    An opus decoder that outputs mono 16 kHz PCM, the format whisper expects.
+
+    Opus decodes to any of its supported rates natively, so this is cheaper
+    than decoding 48 kHz stereo and downmixing afterwards.
+
+    :param on_decoded: Called with the length of every decoded frame
+    """
+
+    SAMPLING_RATE = SAMPLING_RATE
+    CHANNELS = 1
+    SAMPLE_SIZE = struct.calcsize("h") * CHANNELS
+    SAMPLES_PER_FRAME = int(SAMPLING_RATE / 1000 * Decoder.FRAME_LENGTH)
+    FRAME_SIZE = SAMPLES_PER_FRAME * SAMPLE_SIZE
+
+    def __init__(self, on_decoded):
+        super().__init__()
+        self.on_decoded = on_decoded
+
+    def decode(self, data, *, fec=False):
+        pcm = super().decode(data, fec=fec)
+        self.on_decoded(len(pcm))
+        return pcm
+
+
+class SkipDecoder:
+    """Stands in for the decoder of users that aren't being transcribed."""
+
+    def __init__(self, on_decoded):
+        self.on_decoded = on_decoded
+
+    def decode(self, data, *, fec=False):
+        self.on_decoded(0)
+        return b""
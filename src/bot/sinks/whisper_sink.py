@@ -1,20 +1,23 @@
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
-import io
+from concurrent.futures import Future
+import heapq
+import itertools
 import logging
 import re
 import threading
 import time
-import wave
-from queue import Queue
 from tempfile import NamedTemporaryFile
-from typing import List
+from typing import Dict
 
-import speech_recognition as sr
 from discord.sinks.core import Filters, Sink, default_filters
-from faster_whisper import WhisperModel
 
-audio_model = WhisperModel("medium.en", device="cpu", compute_type="float32")
+from src.bot.sinks.speech_decoder import SkipDecoder, SpeechDecoder
+from src.transcription.audio import pcm_to_float32
+from src.transcription.scheduler import (InferenceScheduler,
+                                         get_inference_scheduler)
+from src.transcription.streaming import LocalAgreement
+from src.transcription.vad import StreamingVAD
+from src.utils.strings import find_wake_word_start
 
 logger = logging.getLogger(__name__)
 
@@ -24,26 +27,50 @@ class Speaker:
     A class to store the audio data and transcription for each user.
     """
 
-    def __init__(self, user, data):
+    def __init__(self, user, stream: LocalAgreement, vad: StreamingVAD, awake=True):
         self.user = user
-        self.data = [data]
+        self.data = []
+        self.stream = stream
+        self.vad = vad
+
+        # Set once the VAD heard speech, until then only a short pre-roll is kept
+        self.has_speech = False
+        self.trailing_silence = 0
+
+        # The full model only runs once the wake word spotter fired
+        self.awake = awake
+        # All audio since the phrase started, `data` only holds the window
+        # that streaming hasn't committed yet
+        self.utterance = []
 
         current_time = time.time()
         self.last_word = current_time
         self.last_phrase = current_time
+        # The last time speech came in, the word timeout decays from then on
+        self.last_speech = current_time
 
         self.word_timeout = 0
 
         self.phrase = ""
 
         self.empty_bytes_counter = 0
-        self.new_bytes = 1
+        self.new_bytes = 0
+
+        self.next_inference = 0
+        # The deadline last pushed to the sink's heap
+        self.deadline = None
+
+    def append(self, chunk):
+        self.data.append(chunk)
+        if self.awake:
+            self.utterance.append(chunk)
 
 
 class WhisperSink(Sink):
     """A sink for discord that takes audio in a voice channel and transcribes it for each user.
 
-    Uses faster whisper for transcription. can be swapped out for other audio transcription libraries pretty easily.
+    Uses faster whisper for transcription. Windows are decoded by the process wide inference scheduler, which batches them with the other guilds.
+    A fast model produces the partials that drive endpointing, the accurate model only decodes each finished phrase once.
 
     :param transcript_queue: The queue to send the transcription output to
     :param filters: Some discord thing I'm not sure about
@@ -54,8 +81,23 @@ class WhisperSink(Sink):
     :param max_phrase_timeout: Send out the current transcription after x seconds if the user continues to talk for a long period
     :param min_phrase_length: Minimum length of transcription to reduce noise
     :param max_speakers: The amount of users to transcribe when all speakers are talking at once.
+    :param stream_min_tail: Seconds at the end of the audio window that are never committed while streaming
+    :param stream_max_window: Commit the current hypothesis once the uncommitted audio window grows past this many seconds
+    :param vad_pre_roll: Seconds of audio kept from before the first speech, everything earlier is trimmed
+    :param vad_hangover: Seconds of silence kept after speech, longer pauses are trimmed and never scheduled for inference
+    :param vad_silero_threshold: Speech probability the Silero check must report, None gates on energy only
+    :param wake_words: Only engage the full model for a speaker after a small model heard one of these, None transcribes everything
+    :param wake_word_lookback: Seconds of audio before the wake word was spotted that are still transcribed
+    :param min_inference_interval: Minimum seconds between two decodes of the same speaker
+    :param decode_for_speech: Decode opus straight to mono 16 kHz, and only for admitted speakers, instead of discord's 48 kHz stereo
+    :param scheduler: The inference scheduler to submit windows to, defaults to the process wide one
     """
 
+    # How often the word timeout shrinks by `no_data_multiplier` while no speech comes in
+    NO_DATA_INTERVAL = 0.1
+    # After this many intervals the timeout is as good as gone
+    MAX_DECAY_INTERVALS = 100
+
     def __init__(
         self,
         transcript_queue: asyncio.Queue,
@@ -68,7 +110,17 @@ class WhisperSink(Sink):
         no_data_multiplier=0.75,
         max_phrase_timeout=30,
         min_phrase_length=3,
-        max_speakers=-1
+        max_speakers=-1,
+        stream_min_tail=1.0,
+        stream_max_window=10.0,
+        vad_pre_roll=0.3,
+        vad_hangover=0.5,
+        vad_silero_threshold=0.5,
+        wake_words=None,
+        wake_word_lookback=3.0,
+        min_inference_interval=0.1,
+        decode_for_speech=False,
+        scheduler: InferenceScheduler = None
     ):
         self.queue = transcript_queue
         self.loop = loop
@@ -85,13 +137,35 @@ class WhisperSink(Sink):
         self.max_phrase_timeout = max_phrase_timeout
         self.min_phrase_length = min_phrase_length
         self.max_speakers = max_speakers
+        self.stream_min_tail = stream_min_tail
+        self.stream_max_window = stream_max_window
+        self.vad_pre_roll = vad_pre_roll
+        self.vad_hangover = vad_hangover
+        self.vad_silero_threshold = vad_silero_threshold
+        self.wake_words = wake_words
+        self.wake_word_lookback = wake_word_lookback
+        self.min_inference_interval = min_inference_interval
+        self.decode_for_speech = decode_for_speech
+
+        # PCM format of the packets handed to write(), known once recording starts
+        self.sampling_rate = None
+        self.channels = None
+        self.sample_size = None
+        # ssrc -> (user id, SpeechDecoder), and the length of the frame decoded last
+        self.decoders = {}
+        self.last_decoded_length = 0
 
         self.vc = None
         self.audio_data = {}
         self.running = True
-        self.speakers: List[Speaker] = []
-        self.voice_queue = Queue()
-        self.executor = ThreadPoolExecutor(max_workers=8)  # TODO: Adjust this
+        self.speakers: Dict[int, Speaker] = {}
+        # Written by the decoder thread, drained by the voice thread
+        self.pending_packets = []
+        self.pending_condition = threading.Condition()
+        # Times the voice thread has to wake up at, entries may be stale
+        self.deadlines = []
+        self.scheduler = scheduler or get_inference_scheduler()
+        self.final_ids = itertools.count()
 
     def start_voice_thread(self, on_exception=None):
         def thread_exception_hook(args):
@@ -111,8 +185,58 @@ Likely disconnected while listening.""")
 
         self.voice_thread.start()
 
+    def init(self, vc):
+        super().init(vc)
+
+        if self.decode_for_speech:
+            self.sampling_rate = SpeechDecoder.SAMPLING_RATE
+            self.channels = SpeechDecoder.CHANNELS
+            self.sample_size = SpeechDecoder.SAMPLE_SIZE
+            vc.decoder.get_decoder = self.get_decoder
+        else:
+            self.sampling_rate = vc.decoder.SAMPLING_RATE
+            self.channels = vc.decoder.CHANNELS
+            self.sample_size = vc.decoder.SAMPLE_SIZE
+
+    def admits(self, user):
+        return (
+            self.max_speakers < 0
+            or user in self.speakers
+            or len(self.speakers) <= self.max_speakers
+        )
+
+    def get_decoder(self, ssrc):
+        """Replaces the voice client's decoder lookup when decoding for speech."""
+        user = self.vc.ws.ssrc_map.get(ssrc, {}).get("user_id", None)
+        if user is not None and not self.admits(user):
+            # Not cached, they get a decoder once a slot frees up
+            return SkipDecoder(self._set_last_decoded_length)
+
+        entry = self.decoders.get(ssrc, None)
+        if entry is None:
+            entry = (user, SpeechDecoder(self._set_last_decoded_length))
+            self.decoders[ssrc] = entry
+
+        return entry[1]
+
+    def remove_speaker(self, speaker: Speaker):
+        del self.speakers[speaker.user]
+        # A new decoder is made if they speak again, runs on another thread than get_decoder
+        for ssrc, (user, _) in list(self.decoders.items()):
+            if user == speaker.user:
+                self.decoders.pop(ssrc, None)
+
+    def _set_last_decoded_length(self, length):
+        # Decoding and write() happen on the same decoder thread
+        self.last_decoded_length = length
+
+    def wake_voice_thread(self):
+        with self.pending_condition:
+            self.pending_condition.notify()
+
     def stop_voice_thread(self):
         self.running = False
+        self.wake_voice_thread()
         try:
             self.voice_thread.join()
         except Exception as e:
@@ -121,108 +245,274 @@ Likely disconnected while listening.""")
             logger.debug(
                 f"A sink thread was stopped for guild {self.vc.channel.guild.id}.")
 
-    def transcribe_audio(self, temp_file):
-        try:
-            # The whisper model
-            segments, info = audio_model.transcribe(
-                temp_file,
-                beam_size=10,
-                best_of=3,
-                vad_filter=True,
-                vad_parameters=dict(
-                    min_silence_duration_ms=150,
-                    threshold=0.8
-                ),
-                no_speech_threshold=0.6,
-                initial_prompt="Hey Billy, Okay Billy, and Yo Billy are all wake words for a smart assistant. You're job is to transcribe their resquest as a full sentence. Keywords: GIFs, videos, music, YouTube, Yeat, Discord, play, volume, resume, pause, stop.",
-            )
-
-            segments = list(segments)
-            result = ""
-            for segment in segments:
-                result += segment.text
-
-            return result
-        except Exception as e:
-            logger.error(f"Error transcribing audio: {e}")
-            return ""
-
-    def transcribe(self, speaker: Speaker):
-        audio_data = sr.AudioData(
-            bytes().join(speaker.data),
-            self.vc.decoder.SAMPLING_RATE,
-            self.vc.decoder.SAMPLE_SIZE // self.vc.decoder.CHANNELS,
+    def transcribe(self, speaker: Speaker) -> Future:
+        # Committed audio has already been dropped, so this is only the tail
+        # that the model hasn't settled on yet.
+        window = bytes().join(speaker.data)
+        speaker.data = [window]
+
+        audio = pcm_to_float32(
+            window, self.sampling_rate, self.channels)
+
+        return self.scheduler.submit(
+            self.vc.channel.guild.id, speaker.user, audio, profile="partial")
+
+    def finalize(self, speaker: Speaker):
+        """
+        Decode the whole utterance once with the accurate model and publish it.
+
+        Partials only drive the endpointing, so this is the only time the
+        final profile runs for a phrase. The partial phrase is published if
+        the final pass fails.
+        """
+        partial = speaker.phrase
+        audio = pcm_to_float32(
+            bytes().join(speaker.utterance), self.sampling_rate, self.channels)
+
+        future = self.scheduler.submit(
+            self.vc.channel.guild.id,
+            (speaker.user, next(self.final_ids)),
+            audio,
+            profile="final",
+            deadline=0,
+            expire=False,
         )
 
-        wav_data = io.BytesIO(audio_data.get_wav_data())
-
-        wav_io = io.BytesIO()
-        with wave.open(wav_io, "wb") as wave_writer:
-            wave_writer.setnchannels(self.vc.decoder.CHANNELS)
-            wave_writer.setsampwidth(
-                self.vc.decoder.SAMPLE_SIZE // self.vc.decoder.CHANNELS)
-            wave_writer.setframerate(self.vc.decoder.SAMPLING_RATE)
-            wave_writer.writeframes(wav_data.getvalue())
-
-        wav_io.seek(0)
-
-        transcription = self.transcribe_audio(wav_io)
-
-        return transcription
+        def publish(future):
+            words = future.result()
+            text = "".join(word.text for word in words or []).strip()
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, {
+                "user": speaker.user, "result": text or partial})
+
+        future.add_done_callback(publish)
+
+    def spot_wake_word(self, speaker: Speaker) -> Future:
+        # Until the wake word is heard only the lookback window is kept
+        window = bytes().join(speaker.data)[-self._seconds_to_bytes(
+            self.wake_word_lookback):]
+        speaker.data = [window]
+
+        audio = pcm_to_float32(
+            window, self.sampling_rate, self.channels)
+
+        return self.scheduler.submit(
+            self.vc.channel.guild.id, speaker.user, audio, profile="wake")
+
+    def update_wake_word_status(self, speaker: Speaker, words):
+        text = "".join(word.text for word in words)
+
+        # No phrase has started yet, keep the speaker around while they talk
+        speaker.last_phrase = time.time()
+
+        if find_wake_word_start(self.wake_words, text) == -1:
+            return
+
+        logger.debug(f"Wake word spotted in: {text}")
+        speaker.awake = True
+        speaker.utterance = list(speaker.data)
+        # Run the full model on the lookback window next tick
+        speaker.new_bytes = max(speaker.new_bytes, 2)
+
+    def commit_transcription(self, speaker: Speaker, words) -> str:
+        window = speaker.data[0]
+
+        frame_size = self.sample_size
+        bytes_per_second = self.sampling_rate * frame_size
+        cut = speaker.stream.update(words, len(window) / bytes_per_second)
+        if cut > 0:
+            cut_bytes = int(cut * self.sampling_rate) * frame_size
+            speaker.data[0] = window[cut_bytes:]
+
+        return speaker.stream.text()
+
+    def _seconds_to_bytes(self, seconds):
+        return int(seconds * self.sampling_rate) * self.sample_size
+
+    def ingest(self, speaker: Speaker, packets):
+        """
+        Run the new packets of a speaker through the VAD.
+
+        Only speech counts towards `new_bytes`, so silence and noise never
+        schedule inference. Silence before the first speech is trimmed to a
+        short pre-roll and silence after speech to a short hangover.
+        """
+        chunk = bytes().join(packets)
+        audio = pcm_to_float32(
+            chunk, self.sampling_rate, self.channels)
+
+        if speaker.vad.is_speech(audio):
+            speaker.has_speech = True
+            speaker.trailing_silence = 0
+            speaker.append(chunk)
+            speaker.new_bytes += len(packets)
+            speaker.last_speech = time.time()
+        elif not speaker.has_speech:
+            pre_roll = self._seconds_to_bytes(self.vad_pre_roll)
+            speaker.data = [(bytes().join(speaker.data) + chunk)[-pre_roll:]]
+            if speaker.awake:
+                speaker.utterance = list(speaker.data)
+        else:
+            allowed = self._seconds_to_bytes(
+                self.vad_hangover) - speaker.trailing_silence
+            if allowed > 0:
+                speaker.append(chunk[:allowed])
+                speaker.trailing_silence += min(allowed, len(chunk))
+
+    def drain_voice_packets(self):
+        """
+        Move the packets written since the last drain into the speaker buffers.
+
+        The pending list is swapped out with a single lock acquisition and the
+        packets of each speaker are ingested together.
+        """
+        with self.pending_condition:
+            packets, self.pending_packets = self.pending_packets, []
+
+        incoming = {}
+        for user, data in packets:
+            incoming.setdefault(user, []).append(data)
+
+        for user, user_packets in incoming.items():
+            # Find or create a speaker
+            speaker = self.speakers.get(user, None)
+            if speaker is None:
+                if not self.admits(user):
+                    continue
+
+                speaker = Speaker(
+                    user,
+                    LocalAgreement(self.stream_min_tail,
+                                   self.stream_max_window),
+                    StreamingVAD(
+                        silero_threshold=self.vad_silero_threshold),
+                    awake=self.wake_words is None,
+                )
+                self.speakers[user] = speaker
+
+            self.ingest(speaker, user_packets)
 
     def insert_voice(self):
         while self.running:
             try:
-                # Process the voice_queue
-                while not self.voice_queue.empty():
-                    item = self.voice_queue.get()
-
-                    # Find or create a speaker
-                    speaker = next(
-                        (s for s in self.speakers if s.user == item[0]), None)
-                    if speaker:
-                        speaker.data.append(item[1])
-                        speaker.new_bytes += 1
-                    elif self.max_speakers < 0 or len(self.speakers) <= self.max_speakers:
-                        self.speakers.append(Speaker(item[0], item[1]))
-
-                # Transcribe audio for each speaker
-                future_to_speaker = {}
-                for speaker in self.speakers:
-                    if speaker.new_bytes > 1:
-                        speaker.new_bytes = 0
-
-                        future = self.executor.submit(self.transcribe, speaker)
-                        future_to_speaker[future] = speaker
-                    else:
-                        # No data coming in from discord, reduces word_timeout for faster inference
-                        speaker.word_timeout = round(
-                            speaker.word_timeout * self.no_data_multiplier, 2)
-
-                for future in future_to_speaker:
-                    speaker = future_to_speaker[future]
-                    try:
-                        transcription = future.result()
-                        current_time = time.time()
-                        speaker_new_bytes = speaker.new_bytes
-
-                        self.update_speaker_status(
-                            speaker, transcription, current_time, speaker_new_bytes)
-                    except Exception as e:
-                        logger.warn(f"Error in insert_voice future: {e}")
-
+                self.wait_for_work()
+                self.drain_voice_packets()
+                self.transcribe_speakers()
                 self.check_speaker_timeouts()
-
-                # Loops with no wait time is bad
-                time.sleep(0.1)
+                self.schedule_deadlines()
             except Exception as e:
                 logger.error(f"Error in insert_voice: {e}")
 
+    def wait_for_work(self):
+        """
+        Sleep until packets arrive or the earliest speaker deadline passes.
+
+        A sink without speakers waits without a timeout, so idle guilds cost
+        nothing.
+        """
+        with self.pending_condition:
+            while self.running and not self.pending_packets:
+                now = time.time()
+                if self.deadlines and self.deadlines[0] <= now:
+                    break
+
+                timeout = self.deadlines[0] - now if self.deadlines else None
+                self.pending_condition.wait(timeout)
+
+            now = time.time()
+            while self.deadlines and self.deadlines[0] <= now:
+                heapq.heappop(self.deadlines)
+
+    def schedule_deadlines(self):
+        for speaker in self.speakers.values():
+            deadline = self.speaker_deadline(speaker)
+            if deadline != speaker.deadline:
+                speaker.deadline = deadline
+                heapq.heappush(self.deadlines, deadline)
+
+    def word_timeout(self, speaker: Speaker, now):
+        """
+        The speaker's word timeout at `now`, shrunk by `no_data_multiplier`
+        for every `NO_DATA_INTERVAL` without speech.
+        """
+        idle_intervals = max(0, int((now - speaker.last_speech) // self.NO_DATA_INTERVAL))
+        return speaker.word_timeout * self.no_data_multiplier ** idle_intervals
+
+    def word_deadline(self, speaker: Speaker):
+        """When the speaker's phrase is over if nothing new comes in, with the word timeout decaying."""
+        if self.no_data_multiplier >= 1:
+            return speaker.last_word + speaker.word_timeout
+
+        # Walk the intervals the timeout is constant in until one contains its end
+        start = speaker.last_speech
+        for intervals in range(self.MAX_DECAY_INTERVALS):
+            end = start + self.NO_DATA_INTERVAL
+            deadline = max(start, speaker.last_word +
+                           speaker.word_timeout * self.no_data_multiplier ** intervals)
+            if deadline < end:
+                return deadline
+            start = end
+
+        return start
+
+    def speaker_deadline(self, speaker: Speaker):
+        """The next time the voice thread has to look at this speaker."""
+        if len(speaker.phrase) >= self.min_phrase_length:
+            deadline = min(self.word_deadline(speaker),
+                           speaker.last_phrase + self.max_phrase_timeout)
+        else:
+            deadline = speaker.last_phrase + self.quiet_phrase_timeout * 2
+
+        if speaker.new_bytes > 1:
+            # Speech is waiting for the inference interval to pass
+            deadline = min(deadline, speaker.next_inference)
+
+        return deadline
+
+    def transcribe_speakers(self):
+        now = time.time()
+        future_to_speaker = {}
+        for speaker in self.speakers.values():
+            if speaker.new_bytes > 1 and now >= speaker.next_inference:
+                speaker.new_bytes = 0
+                speaker.next_inference = now + self.min_inference_interval
+
+                if speaker.awake:
+                    future = self.transcribe(speaker)
+                else:
+                    future = self.spot_wake_word(speaker)
+                future_to_speaker[future] = speaker
+
+        for future in future_to_speaker:
+            speaker = future_to_speaker[future]
+            try:
+                words = future.result()
+                if words is None:
+                    # Dropped by the scheduler, try again
+                    speaker.new_bytes = max(speaker.new_bytes, 2)
+                    continue
+
+                if not speaker.awake:
+                    self.update_wake_word_status(speaker, words)
+                    continue
+
+                transcription = self.commit_transcription(
+                    speaker, words)
+                current_time = time.time()
+
+                self.update_speaker_status(
+                    speaker, transcription, current_time)
+            except Exception as e:
+                logger.warn(f"Error in insert_voice future: {e}")
+
+        # Pick up what arrived while decoding
+        self.drain_voice_packets()
+
     def check_speaker_timeouts(self):
         current_time = time.time()
         # Copy the list to avoid modification during iteration
-        for speaker in self.speakers[:]:
-            word_timeout = speaker.word_timeout
+        for speaker in list(self.speakers.values()):
+            # No data coming in from discord shortens the timeout for faster inference
+            word_timeout = self.word_timeout(speaker, current_time)
             if len(speaker.phrase) >= self.min_phrase_length:
                 # If the user stops saying anything new or has been speaking too long.
                 logger.debug(
@@ -231,14 +521,13 @@ Likely disconnected while listening.""")
                     current_time - speaker.last_word > word_timeout
                     or current_time - speaker.last_phrase > self.max_phrase_timeout
                 ):
-                    self.loop.call_soon_threadsafe(self.queue.put_nowait, {
-                        "user": speaker.user, "result": speaker.phrase})
-                    self.speakers.remove(speaker)
+                    self.finalize(speaker)
+                    self.remove_speaker(speaker)
             elif current_time - speaker.last_phrase > self.quiet_phrase_timeout * 2:
                 # Remove the speaker if no valid phrase detected after set period of time
-                self.speakers.remove(speaker)
+                self.remove_speaker(speaker)
 
-    def update_speaker_status(self, speaker, transcription, current_time, speaker_new_bytes):
+    def update_speaker_status(self, speaker, transcription, current_time):
         # If the transcription is different from the last one, reset the word timeout
         if speaker.phrase != transcription:
             logger.debug(
@@ -251,7 +540,10 @@ Likely disconnected while listening.""")
             speaker.phrase = transcription
             speaker.last_word = current_time
         elif speaker.empty_bytes_counter > 5:
-            speaker.data = speaker.data[:-speaker_new_bytes]
+            # The tail stopped changing, commit it so its audio isn't decoded again
+            speaker.stream.commit_all()
+            # Everything is committed, there's no audio left to decode
+            speaker.data = []
         else:
             speaker.empty_bytes_counter += 1
 
@@ -261,15 +553,32 @@ Likely disconnected while listening.""")
         # Discord will send empty bytes from when the user stopped talking to when the user starts to talk again.
         # Its only the first data that grows massive and its only silent audio, so its trimmed.
 
+        if not self.admits(user):
+            return
+
+        data_length = self.data_length
+        if self.decode_for_speech:
+            # The voice client pads the gap since the last packet with silence
+            # sized for 48 kHz stereo, scale it down to the speech format.
+            silence = len(data) - self.last_decoded_length
+            if silence > 0:
+                data = bytes(silence // 6 // self.sample_size * self.sample_size) + \
+                    data[silence:]
+            data_length = self.data_length // 6
+
         data_len = len(data)
-        if data_len > self.data_length:
-            data = data[-self.data_length:]
+        if data_len > data_length:
+            data = data[-data_length:]
 
         # Send bytes to be transcribed
-        self.voice_queue.put_nowait([user, data])
+        with self.pending_condition:
+            self.pending_packets.append((user, data))
+            if len(self.pending_packets) == 1:
+                self.pending_condition.notify()
 
     def close(self):
         logger.debug("Closing whisper sink.")
         self.running = False
+        self.wake_voice_thread()
         self.queue.put_nowait(None)
         super().cleanup()
@@ -3,3 +3,34 @@ from src.utils.commandline import CommandLine
 
 class CLIArgs(CommandLine):
     verbose = False
+    partial_model = "base.en"
+    final_model = "medium.en"
+    wake_model = "tiny.en"
+    decode_options = None
+    whisper_compute_type = "float32"
+    whisper_cpu_threads = 0
+    whisper_num_workers = 1
+    inference_batch_size = 8
+    decode_for_speech = False
+    audio_cache_dir = ".cache/audio"
+    audio_cache_size_mb = 512
+    ytdl_workers = 4
+    ytdl_cache_ttl = 3600
+    fast_start = True
+    music_playback_mode = "pcm"
+    audio_mixer = True
+    duck_gain = 0.35
+    prefetch_count = 50
+    action_queue_size = 100
+    guild_actions_in_flight = 16
+    shard_id = None
+    shard_count = None
+    publisher_channels = 2
+    publisher_confirms = False
+    entitlement_ttl = 300
+    entitlement_negative_ttl = 60
+    stripe_webhook_port = None
+    nickname_debounce = 0.25
+    nickname_min_interval = 1.0
+    metrics_interval = 60
+    wake_word_lookback = 3.0
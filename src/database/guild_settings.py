@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from src.database.guilds import DBGuilds
+from src.utils.single_flight import SingleFlight
+from supabase import Client
+
+logger = logging.getLogger(__name__)
+
+
+class GuildSettingsStore:
+    """
+    A write-through, in-memory cache of the `guild_settings` rows.
+
+    Every supabase call runs on a thread pool of its own instead of the event
+    loop. They share the one client, so the HTTP connections are reused.
+    Reads are served from memory once a row was loaded. Writes update
+    memory right away and are sent after `write_delay` seconds, merged with
+    any other change to the same guild in the meantime.
+
+    :param max_workers: Database calls that may run at once
+    :param write_delay: Seconds to wait for more changes before writing
+    """
+
+    def __init__(self, supabase: Client, max_workers=4, write_delay=0.5):
+        self.supabase = supabase
+        self.write_delay = write_delay
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="supabase")
+        # guild id -> row, None for guilds known to have none
+        self.rows = {}
+        self.loading = SingleFlight()
+        # guild id -> columns changed since the last write
+        self.pending_writes = {}
+        self.write_tasks = {}
+
+    async def run(self, fn, *args):
+        """Run a blocking database call on the pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    def _select(self, guild_id):
+        response = self.supabase.table("guild_settings")\
+            .select("*")\
+            .eq("guild_id", str(guild_id))\
+            .execute()
+
+        return response.data[0] if response.data else None
+
+    def _select_page(self, guild_ids):
+        response = self.supabase.table("guild_settings")\
+            .select("*")\
+            .in_("guild_id", [str(guild_id) for guild_id in guild_ids])\
+            .execute()
+
+        return response.data
+
+    async def preload(self, guild_ids, page_size=100):
+        """
+        Load the rows of many guilds, `page_size` guilds per query.
+
+        The guild ids go into the query string, a page of 100 keeps the URL
+        around 2 KB, well below what proxies accept. Guilds without a row are
+        remembered as such, so they aren't queried one by one later either.
+        A page that fails is logged and its guilds are loaded on first use.
+        """
+        guild_ids = [guild_id for guild_id in guild_ids if guild_id not in self.rows]
+        loaded = failed = 0
+        for start in range(0, len(guild_ids), page_size):
+            page = guild_ids[start:start + page_size]
+            try:
+                rows = await self.run(self._select_page, page)
+            except Exception as e:
+                logger.error(f"Error preloading settings of {len(page)} guilds: {e}")
+                failed += len(page)
+                continue
+
+            found = {int(row["guild_id"]): row for row in rows}
+            for guild_id in page:
+                # Loaded or written to while this page was in flight
+                if guild_id in self.rows or guild_id in self.pending_writes:
+                    continue
+                self.rows[guild_id] = found.get(guild_id, None)
+            loaded += len(found)
+
+        logger.info(
+            f"Preloaded settings of {loaded} of {len(guild_ids)} guilds, {failed} failed to load.")
+
+    async def get(self, guild_id):
+        """The guild's row, loaded from the database the first time."""
+        if guild_id in self.rows:
+            return self.rows[guild_id]
+
+        async def load():
+            row = await self.run(self._select, guild_id)
+            # A write during the load is newer than what was read
+            if guild_id in self.pending_writes and row is not None:
+                row.update(self.pending_writes[guild_id])
+            self.rows[guild_id] = row
+            return row
+
+        return await self.loading.do(guild_id, load)
+
+    def update(self, guild_id, **values):
+        """Change columns of the guild's row, the write happens in the background."""
+        row = self.rows.get(guild_id, None)
+        if row is not None:
+            row.update(values)
+
+        self.pending_writes.setdefault(guild_id, {}).update(values)
+        if guild_id not in self.write_tasks:
+            self.write_tasks[guild_id] = asyncio.get_running_loop().create_task(
+                self._write_later(guild_id))
+
+    def _update(self, guild_id, values):
+        self.supabase.table("guild_settings")\
+            .update(values)\
+            .eq("guild_id", str(guild_id))\
+            .execute()
+
+    async def _write_later(self, guild_id):
+        await asyncio.sleep(self.write_delay)
+        await self.flush(guild_id)
+
+    async def flush(self, guild_id):
+        self.write_tasks.pop(guild_id, None)
+        values = self.pending_writes.pop(guild_id, None)
+        if not values:
+            return
+
+        try:
+            await self.run(self._update, guild_id, values)
+            logger.debug(f"Wrote {values} to the settings of guild {guild_id}.")
+        except Exception as e:
+            logger.error(f"Error writing settings of guild {guild_id}: {e}")
+            # Unknown what the database has now, read it again next time
+            self.rows.pop(guild_id, None)
+
+    async def flush_all(self):
+        for guild_id in list(self.pending_writes):
+            task = self.write_tasks.pop(guild_id, None)
+            if task:
+                task.cancel()
+            await self.flush(guild_id)
+
+    async def create(self, owner_id: int, guild_id: int) -> bool:
+        """
+        Create the guild's row, see `DBGuilds.create_guild_settings`.
+        """
+        successful = await self.run(
+            DBGuilds(self.supabase).create_guild_settings, owner_id, guild_id)
+        # Load the row as it is now on the next read
+        self.rows.pop(guild_id, None)
+        return successful
@@ -1,6 +1,6 @@
 import logging
 
-from src.database.supabase import Client
+from supabase import Client
 
 logger = logging.getLogger(__name__)
 
@@ -0,0 +1,259 @@
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from collections import OrderedDict
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# 48 kHz stereo s16le, the format discord plays without resampling
+PCM_BYTES_PER_SECOND = discord.opus.Encoder.SAMPLING_RATE * \
+    discord.opus.Encoder.SAMPLE_SIZE
+FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE
+
+
+class CachedPCMAudio(discord.AudioSource):
+    """Plays a cached clip by reading frames straight out of a memory map."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._position = 0
+
+    def read(self):
+        end = self._position + FRAME_SIZE
+        if end > len(self._mmap):
+            return b""
+
+        frame = self._mmap[self._position:end]
+        self._position = end
+        return frame
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        if not self._mmap.closed:
+            self._mmap.close()
+
+
+class RecordingAudio(discord.AudioSource):
+    """
+    Plays a PCM source and writes the frames it reads into the audio cache.
+
+    The clip is cached once the source ends by itself. A clip that's cut off
+    by `cleanup` first, or that's shorter than `expected_seconds`, e.g.
+    because the stream broke off, isn't.
+    """
+
+    def __init__(self, cache, key, source, truncate=True, expected_seconds=None):
+        self.cache = cache
+        self.key = key
+        self.source = source
+        self.truncate = truncate
+        self.max_size = cache.max_clip_seconds * PCM_BYTES_PER_SECOND
+        self.min_size = int((expected_seconds or 0) * 0.95 * PCM_BYTES_PER_SECOND)
+
+        self.tmp_path = f"{cache._path(key)}.tmp"
+        self.file = open(self.tmp_path, "wb")
+        self.size = 0
+        # cleanup may come from another thread than the player's reads
+        self.lock = threading.Lock()
+
+    def read(self):
+        frame = self.source.read()
+        with self.lock:
+            if self.file is not None:
+                try:
+                    self._write(frame)
+                except OSError as e:
+                    # Playback goes on without caching
+                    logger.warning(f"Could not cache clip {self.key}: {e}")
+                    self._abort()
+        return frame
+
+    def _write(self, frame):
+        if not frame:
+            if self.size and self.size >= self.min_size:
+                self._commit()
+            else:
+                logger.debug(f"Not caching {self.key}, it ended early.")
+                self._abort()
+        elif self.size + len(frame) > self.max_size:
+            if self.truncate:
+                self.file.write(frame[:self.max_size - self.size])
+                self.size = self.max_size
+                self._commit()
+            else:
+                logger.debug(f"Not caching {self.key}, it's longer than the limit.")
+                self._abort()
+        else:
+            self.file.write(frame)
+            self.size += len(frame)
+
+    def _commit(self):
+        self.file.close()
+        self.file = None
+        try:
+            self.cache._add(self.key, self.tmp_path, self.size)
+        except Exception as e:
+            logger.warning(f"Could not cache clip {self.key}: {e}")
+            self._abort()
+
+    def _abort(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.cache._release(self.key)
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        with self.lock:
+            if self.file is not None:
+                self._abort()
+        self.source.cleanup()
+
+
+class AudioCache:
+    """
+    A size bounded, disk backed LRU cache of decoded sound effects and TTS clips.
+
+    Clips are stored as 48 kHz stereo PCM, so a cache hit plays without
+    yt-dlp or ffmpeg. Entries are keyed by the sha256 of their URL or, for
+    clips that arrive as data, of their content. Clips are cached from the
+    frames they play with `record`, so they're only decoded once.
+
+    :param directory: Where the clips are stored, survives restarts
+    :param max_bytes: Least recently used clips are evicted above this size
+    :param max_clip_seconds: Longer clips are cut (sound effects) or not cached (TTS)
+    """
+
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, max_clip_seconds=30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_clip_seconds = max_clip_seconds
+
+        self.lock = threading.Lock()
+        # key -> size in bytes, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.in_flight = set()
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def key_for_url(url: str):
+        return hashlib.sha256(url.strip().encode()).hexdigest()
+
+    @staticmethod
+    def key_for_data(data: bytes):
+        return hashlib.sha256(data).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".pcm"):
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+            elif name.endswith(".tmp"):
+                # Left behind by an interrupted recording
+                os.remove(path)
+
+        for _, key, size in sorted(files):
+            self.entries[key] = size
+            self.total_bytes += size
+
+        logger.debug(
+            f"Audio cache has {len(self.entries)} clips ({self.total_bytes} bytes).")
+
+    def get(self, key):
+        """Return a playable source for `key`, or None on a miss."""
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return CachedPCMAudio(path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable cached clip {key}: {e}")
+            self._remove(key)
+            return None
+
+    def _remove(self, key):
+        with self.lock:
+            size = self.entries.pop(key, None)
+            if size is None:
+                return
+            self.total_bytes -= size
+
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while True:
+            with self.lock:
+                if self.total_bytes <= self.max_bytes or not self.entries:
+                    return
+                key = next(iter(self.entries))
+
+            logger.debug(f"Evicting cached clip {key}.")
+            self._remove(key)
+
+    def _claim(self, key):
+        """Reserve `key` for one writer, False if it's cached or being written."""
+        with self.lock:
+            if key in self.entries or key in self.in_flight:
+                return False
+            self.in_flight.add(key)
+            return True
+
+    def _release(self, key):
+        with self.lock:
+            self.in_flight.discard(key)
+
+    def _add(self, key, tmp_path, size):
+        """Move a written clip into the cache and release its claim."""
+        try:
+            os.replace(tmp_path, self._path(key))
+            with self.lock:
+                self.entries[key] = size
+                self.total_bytes += size
+        finally:
+            self._release(key)
+
+        self._evict()
+
+    def record(self, key, source, *, truncate=True, expected_seconds=None):
+        """
+        Wrap a PCM source so the frames it plays are cached, see `RecordingAudio`.
+
+        Returns `source` itself if the clip is cached or being cached already.
+        """
+        if not self._claim(key):
+            return source
+
+        try:
+            return RecordingAudio(self, key, source, truncate, expected_seconds)
+        except OSError as e:
+            logger.warning(f"Could not cache clip {key}: {e}")
+            self._release(key)
+            return source
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse, urlunparse
+
+from src.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Map URLs and search queries that yt-dlp resolves the same way to one key.
+
+    YouTube links become `youtube:<video id>`, other URLs lose their fragment
+    and `www.`, search queries are lowercased with whitespace collapsed.
+    """
+    query = query.strip()
+    parsed = urlparse(query)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return " ".join(query.lower().split())
+
+    host = parsed.netloc.lower()
+    for prefix in ("www.", "m.", "music."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+
+    if host == "youtu.be":
+        return f"youtube:{parsed.path.strip('/')}"
+    if host == "youtube.com":
+        video_id = parse_qs(parsed.query).get("v", None)
+        if parsed.path == "/watch" and video_id:
+            return f"youtube:{video_id[0]}"
+        if parsed.path.startswith("/shorts/"):
+            return f"youtube:{parsed.path[len('/shorts/'):].strip('/')}"
+
+    return urlunparse((parsed.scheme.lower(), host, parsed.path, parsed.params, parsed.query, ""))
+
+
+def stream_url_expiry(data: dict):
+    """When the stream URL in `data` stops working, None if it doesn't say."""
+    url = data.get("url", None)
+    if not url:
+        return None
+
+    expire = parse_qs(urlparse(url).query).get("expire", None)
+    try:
+        return float(expire[0]) if expire else None
+    except ValueError:
+        return None
+
+
+class ExtractionCache:
+    """
+    Caches yt-dlp metadata and coalesces concurrent lookups of the same query.
+
+    Extraction runs on its own bounded thread pool, so a burst of requests
+    can't starve the default executor. Entries live for `ttl` seconds, or
+    until shortly before their stream URL expires if that's sooner.
+
+    :param create_ytdl: Creates a YoutubeDL instance, every pool thread gets its own
+    :param max_workers: The amount of extractions that may run at once
+    :param ttl: Seconds an entry is kept at most
+    :param expiry_margin: Seconds before the stream URL expires that an entry is dropped
+    :param max_entries: The least recently used entries are dropped above this
+    """
+
+    def __init__(self, create_ytdl, max_workers=4, ttl=3600, expiry_margin=300, max_entries=1024):
+        self.create_ytdl = create_ytdl
+        self.ttl = ttl
+        self.expiry_margin = expiry_margin
+        self.max_entries = max_entries
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="ytdl")
+        self.local = threading.local()
+        # key -> (expires_at, data), least recently used first
+        self.entries = OrderedDict()
+        self.in_flight = SingleFlight()
+
+    def _extract(self, query):
+        ytdl = getattr(self.local, "ytdl", None)
+        if ytdl is None:
+            ytdl = self.create_ytdl()
+            self.local.ytdl = ytdl
+
+        return ytdl.extract_info(query, download=False)
+
+    def _store(self, key, data):
+        now = time.time()
+        expires_at = now + self.ttl
+        stream_expiry = stream_url_expiry(data)
+        if stream_expiry is not None:
+            expires_at = min(expires_at, stream_expiry - self.expiry_margin)
+
+        if expires_at <= now:
+            return
+
+        self.entries[key] = (expires_at, data)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        entry = self.entries.get(key, None)
+        if entry is None:
+            return None
+
+        expires_at, data = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return data
+
+    async def extract_info(self, query, *, loop=None):
+        loop = loop or asyncio.get_event_loop()
+        key = normalize_query(query)
+
+        data = self.get(key)
+        if data is not None:
+            logger.debug(f"Extraction cache hit for {key}.")
+            return data
+
+        if key in self.in_flight:
+            logger.debug(f"Joining extraction in progress for {key}.")
+
+        async def extract():
+            data = await loop.run_in_executor(self.executor, self._extract, query)
+            self._store(key, data)
+            return data
+
+        return await self.in_flight.do(key, extract)
@@ -0,0 +1,202 @@
+import logging
+import threading
+
+import discord
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE
+FRAME_SAMPLES = FRAME_SIZE // 2
+FRAME_LENGTH = discord.opus.Encoder.FRAME_LENGTH / 1000
+SILENCE_FRAME = b"\x00" * FRAME_SIZE
+
+
+class Layer:
+    def __init__(self, source, after=None):
+        self.source = source
+        self.after = after
+        self.paused = False
+
+
+class MixerSource(discord.AudioSource):
+    """
+    Mixes the music, sound effect and TTS of a guild into one PCM source.
+
+    Every layer plays a PCM source of its own, so a sound effect or TTS
+    plays over the music instead of pausing and restarting it. While TTS
+    plays the music is ducked, ramping its gain down and back up over a
+    few frames. When no layer has played for `idle_timeout` seconds the
+    mixer ends, so the player isn't sending silence; call `play` on the
+    voice client again when a layer is added.
+
+    :param duck_gain: Music gain while TTS plays
+    :param duck_attack: Seconds to duck the music
+    :param duck_release: Seconds to bring the music back up
+    :param idle_timeout: Seconds of silence before the mixer ends
+    """
+
+    DUCKED_BY = ("tts",)
+
+    def __init__(self, duck_gain=0.35, duck_attack=0.1, duck_release=0.3, idle_timeout=0.5):
+        self.duck_gain = duck_gain
+        self.duck_attack_step = (1.0 - duck_gain) / max(1, duck_attack / FRAME_LENGTH)
+        self.duck_release_step = (1.0 - duck_gain) / max(1, duck_release / FRAME_LENGTH)
+        self.idle_frames = int(idle_timeout / FRAME_LENGTH)
+
+        self.lock = threading.Lock()
+        self.layers = {}
+        self.music_gain = 1.0
+        self.idle = 0
+
+    def set_layer(self, name, source, after=None):
+        """
+        Play `source` on a layer, replacing what it played.
+
+        :param after: Called with an error or None once the source ends by itself, on the player thread
+        """
+        with self.lock:
+            old = self.layers.get(name, None)
+            self.layers[name] = Layer(source, after)
+            self.idle = 0
+
+        if old:
+            old.source.cleanup()
+
+    def clear_layer(self, name, source=None):
+        """Stop a layer, only if it still plays `source` when that's given."""
+        with self.lock:
+            layer = self.layers.get(name, None)
+            if layer is None or (source is not None and layer.source is not source):
+                return False
+            del self.layers[name]
+
+        layer.source.cleanup()
+        return True
+
+    def get_source(self, name):
+        layer = self.layers.get(name, None)
+        return layer.source if layer else None
+
+    def pause_layer(self, name):
+        layer = self.layers.get(name, None)
+        if layer is None or layer.paused:
+            return False
+        layer.paused = True
+        return True
+
+    def resume_layer(self, name):
+        layer = self.layers.get(name, None)
+        if layer is None or not layer.paused:
+            return False
+        layer.paused = False
+        self.idle = 0
+        return True
+
+    def is_layer_playing(self, name):
+        layer = self.layers.get(name, None)
+        return layer is not None and not layer.paused
+
+    def has_layers(self):
+        with self.lock:
+            return any(not layer.paused for layer in self.layers.values())
+
+    @property
+    def volume(self):
+        # The music volume, set through the music source like without the mixer
+        source = self.get_source("music")
+        return getattr(source, "volume", 1.0)
+
+    @volume.setter
+    def volume(self, value):
+        source = self.get_source("music")
+        if source is not None and hasattr(source, "volume"):
+            source.volume = value
+
+    def _read_layers(self):
+        with self.lock:
+            layers = [(name, layer) for name, layer in self.layers.items() if not layer.paused]
+
+        frames = {}
+        ended = []
+        for name, layer in layers:
+            try:
+                frame = layer.source.read()
+                error = None
+            except Exception as e:
+                frame, error = b"", e
+
+            if len(frame) > FRAME_SIZE:
+                frame, error = b"", ValueError(
+                    f"{name} layer read {len(frame)} bytes, a frame is {FRAME_SIZE}")
+
+            if not frame:
+                ended.append((name, layer, error))
+                continue
+            if len(frame) < FRAME_SIZE:
+                frame += SILENCE_FRAME[len(frame):]
+            frames[name] = frame
+
+        for name, layer, error in ended:
+            with self.lock:
+                # Replaced or cleared in the meantime, the new source plays on
+                if self.layers.get(name, None) is not layer:
+                    continue
+                del self.layers[name]
+
+            layer.source.cleanup()
+            if layer.after:
+                try:
+                    layer.after(error)
+                except Exception as e:
+                    logger.error(f"Error in {name} layer callback: {e}")
+
+        return frames
+
+    def _next_music_gain(self, frames):
+        target = self.duck_gain if any(name in frames for name in self.DUCKED_BY) else 1.0
+        if self.music_gain > target:
+            return max(target, self.music_gain - self.duck_attack_step)
+        return min(target, self.music_gain + self.duck_release_step)
+
+    def read(self):
+        frames = self._read_layers()
+        if not frames:
+            self.idle += 1
+            return SILENCE_FRAME if self.idle <= self.idle_frames else b""
+        self.idle = 0
+
+        start_gain = self.music_gain
+        self.music_gain = self._next_music_gain(frames)
+
+        music = frames.get("music", None)
+        if len(frames) == 1 and (music is None or start_gain == self.music_gain == 1.0):
+            return next(iter(frames.values()))
+
+        mix = np.zeros(FRAME_SAMPLES, dtype=np.float32)
+        for name, frame in frames.items():
+            samples = np.frombuffer(frame, dtype=np.int16)
+            if name == "music" and start_gain != self.music_gain:
+                # Ramp within the frame so the gain change doesn't click
+                gain = np.linspace(start_gain, self.music_gain, FRAME_SAMPLES // 2, dtype=np.float32)
+                mix += samples * np.repeat(gain, 2)
+            elif name == "music" and self.music_gain != 1.0:
+                mix += samples * np.float32(self.music_gain)
+            else:
+                mix += samples
+
+        return np.clip(mix, -32768, 32767).astype(np.int16).tobytes()
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        # Called by the player whenever the mixer goes idle, the layers outlive it
+        pass
+
+    def close(self):
+        with self.lock:
+            layers, self.layers = self.layers, {}
+
+        for layer in layers.values():
+            layer.source.cleanup()
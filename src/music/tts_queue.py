@@ -1,50 +1,138 @@
 import asyncio
+import inspect
 import logging
+import time
+
+from src.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 
 class TTSQueue:
+    """
+    Plays TTS clips back to back, pausing the music while they play.
+
+    With a mixer the clips play on its TTS layer instead, over the ducked
+    music.
+
+    Clips are queued as sources or as awaitables that resolve to one. The
+    awaitables start resolving when they're added, so the next clip is
+    ready by the time the current one ends.
+    """
+
     def __init__(self, voice_client, helper):
         self.voice_client = voice_client
         self.helper = helper
+        self.loop = helper.bot.loop
         self.tts_sources = asyncio.Queue()
         self.is_playing_tts = False
         self.paused_music_source = None
+        self.player_task = None
+        self.clip_finished = asyncio.Event()
+        # perf_counter() of the end of the last clip, to measure the gap to the next
+        self.last_finished_at = None
 
     async def add_tts(self, tts_source):
+        """
+        Queue a clip, returns without waiting for it to play.
+
+        :param tts_source: An AudioSource, or an awaitable resolving to one (or None to skip it)
+        """
+        if inspect.isawaitable(tts_source):
+            tts_source = asyncio.ensure_future(tts_source)
+
         await self.tts_sources.put(tts_source)
-        if not self.is_playing_tts:
-            await self.play_next_tts()
+        if self.player_task is None or self.player_task.done():
+            self.player_task = self.loop.create_task(self.play_next_tts())
+
+    def close(self):
+        """
+        Stop playing the queue and drop the clips in it.
+
+        Clips that are loaded already are cleaned up, so their ffmpeg
+        processes don't outlive the queue, and the ones still loading are
+        cancelled.
+        """
+        if self.player_task:
+            self.player_task.cancel()
+
+        while not self.tts_sources.empty():
+            tts_source = self.tts_sources.get_nowait()
+            if isinstance(tts_source, asyncio.Future):
+                tts_source.cancel()
+                # Done already, or loaded while being cancelled
+                tts_source.add_done_callback(self._cleanup_loaded)
+            elif tts_source is not None:
+                tts_source.cleanup()
+
+        if self.paused_music_source:
+            self.paused_music_source.cleanup()
+            self.paused_music_source = None
+
+    @staticmethod
+    def _cleanup_loaded(future):
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            future.result().cleanup()
+
+    def replace_paused_music(self, music_source):
+        """Have the music that resumes after the TTS be `music_source`."""
+        if self.paused_music_source and self.paused_music_source is not music_source:
+            self.paused_music_source.cleanup()
+
+        self.paused_music_source = music_source
 
     async def play_next_tts(self):
         if self.is_playing_tts:
             return
 
         self.is_playing_tts = True
-        if self.voice_client.is_playing() and self.helper.current_music_source:
-            # Pause the music and store the current music source
-            self.voice_client.pause()
-            self.paused_music_source = self.voice_client.source if self.helper.current_music_source else None
+        mixer = self.helper.mixer
+        try:
+            if mixer is None and self.voice_client.is_playing() and self.helper.current_music_source:
+                # Pause the music and store the current music source
+                self.voice_client.pause()
+                self.paused_music_source = self.voice_client.source if self.helper.current_music_source else None
 
-        while not self.tts_sources.empty():
-            tts_source = await self.tts_sources.get()
+            while not self.tts_sources.empty():
+                tts_source = self.tts_sources.get_nowait()
+                if isinstance(tts_source, asyncio.Future):
+                    try:
+                        tts_source = await tts_source
+                    except Exception as e:
+                        logger.error(f"Could not load TTS clip: {e}")
+                        continue
 
-            self.voice_client.play(tts_source, after=self.after_callback)
-            await self.wait_for_source_to_finish()
+                if tts_source is None:
+                    continue
 
-        if self.paused_music_source:
-            # Resume the paused music source
-            self.voice_client.play(
-                self.paused_music_source, after=self.helper.music_stopped_callback)
-            self.paused_music_source = None
+                if self.last_finished_at is not None:
+                    metrics.observe(
+                        "tts.gap", time.perf_counter() - self.last_finished_at)
+
+                self.clip_finished.clear()
+                if mixer:
+                    mixer.set_layer("tts", tts_source, after=self.after_callback)
+                    self.helper.ensure_mixer_playing()
+                else:
+                    self.voice_client.play(tts_source, after=self.after_callback)
+                await self.clip_finished.wait()
 
-    async def wait_for_source_to_finish(self):
-        while self.is_playing_tts:
-            await asyncio.sleep(0.1)
+            if self.paused_music_source:
+                # Resume the paused music source
+                self.voice_client.play(
+                    self.paused_music_source, after=self.helper.music_stopped_callback)
+                self.paused_music_source = None
+        finally:
+            self.is_playing_tts = False
+            self.last_finished_at = None
+
+    def _finish_clip(self, finished_at):
+        self.last_finished_at = finished_at
+        self.clip_finished.set()
 
     def after_callback(self, error):
+        # Runs on the player thread
         if error:
             logger.error(f'TTS Player error: {error}')
 
-        self.is_playing_tts = False
+        self.loop.call_soon_threadsafe(self._finish_clip, time.perf_counter())
@@ -0,0 +1,224 @@
+import logging
+import threading
+import time
+
+import discord
+from discord.oggparse import OggError, OggStream
+
+logger = logging.getLogger(__name__)
+
+FRAME_SIZE = discord.opus.Encoder.FRAME_SIZE
+SILENCE_FRAME = b"\x00" * FRAME_SIZE
+# The identification and comment headers that open an Ogg Opus stream
+OPUS_HEADER_MAGIC = (b"OpusHead", b"OpusTags")
+
+
+class ChunkBuffer:
+    """
+    Bytes of a chunked stream in sequence order, read while chunks still arrive.
+
+    Chunks may arrive out of order, they're held back until the ones before
+    them are in. Reads block until enough data is in or the final chunk was
+    read.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.data = bytearray()
+        # seq -> chunk, for chunks that arrived ahead of a missing one
+        self.early = {}
+        self.next_seq = 0
+        self.final_seq = None
+        self.closed = False
+
+    @property
+    def finished(self):
+        return self.closed or (self.final_seq is not None and self.next_seq > self.final_seq)
+
+    def feed(self, seq, chunk, final=False):
+        with self.condition:
+            if seq < self.next_seq or self.closed:
+                return
+            if final:
+                self.final_seq = seq
+
+            self.early[seq] = chunk
+            while self.next_seq in self.early:
+                self.data += self.early.pop(self.next_seq)
+                self.next_seq += 1
+
+            self.condition.notify_all()
+
+    def read(self, size=-1, timeout=None):
+        """
+        Read `size` bytes, less only once the stream is finished.
+
+        :return: The bytes, or None if `timeout` seconds passed first
+        """
+        with self.condition:
+            ready = self.condition.wait_for(
+                lambda: self.finished or (size >= 0 and len(self.data) >= size), timeout)
+            if not ready:
+                return None
+
+            if size < 0:
+                size = len(self.data)
+            data = bytes(self.data[:size])
+            del self.data[:size]
+            return data
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class _BlockingReader:
+    """A file-like view of a ChunkBuffer for readers that expect a blocking stream."""
+
+    def __init__(self, buffer, timeout):
+        self.buffer = buffer
+        self.timeout = timeout
+
+    def read(self, size=-1):
+        data = self.buffer.read(size, timeout=self.timeout)
+        return data if data is not None else b""
+
+
+class TTSStream(discord.AudioSource):
+    """
+    Plays TTS while its chunks are still arriving.
+
+    `pcm` chunks (48 kHz stereo s16le) and `opus` chunks (an Ogg Opus
+    stream) go to discord without ffmpeg, anything else is piped through
+    ffmpeg. When a PCM stream falls behind, silence is played until the
+    next chunk is in, so the player keeps its pace.
+
+    :param format: `pcm`, `opus` or any format ffmpeg reads
+    :param max_stall: Seconds without new audio after which playback ends
+    :param passthrough: Hand opus packets to discord as they are, otherwise they're decoded to PCM
+    """
+
+    def __init__(self, stream_id, format="pcm", max_stall=10.0, passthrough=True):
+        self.stream_id = stream_id
+        self.format = format
+        self.max_stall = max_stall
+        self.passthrough = passthrough
+        self.buffer = ChunkBuffer()
+        self.stalled_since = None
+
+        self.packets = None
+        # Created with the first audio packet when decoding
+        self.decoder = None
+        self.decoded = bytearray()
+        self.ffmpeg = None
+        if format == "opus":
+            self.packets = OggStream(
+                _BlockingReader(self.buffer, max_stall)).iter_packets()
+        elif format != "pcm":
+            self.ffmpeg = discord.FFmpegPCMAudio(
+                _BlockingReader(self.buffer, max_stall), pipe=True)
+
+    @property
+    def closed(self):
+        return self.buffer.closed
+
+    def feed(self, seq, chunk, final=False):
+        self.buffer.feed(seq, chunk, final)
+
+    def _next_packet(self):
+        """The next opus audio packet, b"" at the end of the stream."""
+        try:
+            packet = next(self.packets, b"")
+            while packet.startswith(OPUS_HEADER_MAGIC):
+                packet = next(self.packets, b"")
+            return packet
+        except OggError as e:
+            # A page cut short by a stall
+            logger.warning(f"TTS stream {self.stream_id} ended early: {e}")
+            return b""
+
+    def _read_decoded(self):
+        # A packet may hold more than one frame of audio, hand it out a frame at a time
+        while len(self.decoded) < FRAME_SIZE:
+            packet = self._next_packet()
+            if not packet:
+                break
+            if self.decoder is None:
+                self.decoder = discord.opus.Decoder()
+            self.decoded += self.decoder.decode(packet)
+
+        if not self.decoded:
+            return b""
+
+        frame = bytes(self.decoded[:FRAME_SIZE])
+        del self.decoded[:FRAME_SIZE]
+        if len(frame) < FRAME_SIZE:
+            frame += SILENCE_FRAME[len(frame):]
+        return frame
+
+    def read(self):
+        if self.packets is not None:
+            if self.passthrough:
+                return self._next_packet()
+            return self._read_decoded()
+        if self.ffmpeg is not None:
+            return self.ffmpeg.read()
+
+        # Wait at most half a frame, the player is due to send one
+        frame = self.buffer.read(FRAME_SIZE, timeout=discord.opus.Encoder.FRAME_LENGTH / 2000)
+        if frame is None:
+            now = time.perf_counter()
+            self.stalled_since = self.stalled_since or now
+            if now - self.stalled_since > self.max_stall:
+                logger.warning(f"TTS stream {self.stream_id} stalled, ending it.")
+                return b""
+            return SILENCE_FRAME
+
+        self.stalled_since = None
+        if 0 < len(frame) < FRAME_SIZE:
+            frame += SILENCE_FRAME[len(frame):]
+        return frame
+
+    def is_opus(self):
+        return self.format == "opus" and self.passthrough
+
+    def cleanup(self):
+        self.buffer.close()
+        if self.ffmpeg is not None:
+            self.ffmpeg.cleanup()
+
+
+class TTSStreams:
+    """
+    The TTS streams of a guild that are still receiving chunks, by stream id.
+
+    A stream is kept until every chunk up to its final one is in, or it's
+    closed, so chunks arriving after the final one still find it.
+    """
+
+    def __init__(self):
+        self.streams = {}
+
+    def open(self, stream_id, **kwargs):
+        """
+        The stream with `stream_id`, created with `kwargs` if there's none.
+
+        :return: The stream and whether it was created
+        """
+        # Streams whose chunks never all came end on their own, forget them
+        self.streams = {
+            key: stream for key, stream in self.streams.items() if not stream.closed}
+
+        stream = self.streams.get(stream_id, None)
+        if stream is not None:
+            return stream, False
+
+        stream = TTSStream(stream_id, **kwargs)
+        self.streams[stream_id] = stream
+        return stream, True
+
+    def feed(self, stream, seq, chunk, final=False):
+        stream.feed(seq, chunk, final)
+        if stream.buffer.finished:
+            self.streams.pop(stream.stream_id, None)
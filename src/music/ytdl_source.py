@@ -1,7 +1,17 @@
 import asyncio
+import logging
+import threading
+import time
+
 import discord
 import yt_dlp as youtube_dl
 
+from src.config.cliargs import CLIArgs
+from src.music.extraction_cache import ExtractionCache
+from src.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
 
 # Suppress noise about console usage from errors
 youtube_dl.utils.bug_reports_message = lambda: ''
@@ -28,26 +38,273 @@ ffmpeg_options = {
     'options': '-vn',
 }
 
+# Enough to read the container header when yt-dlp already told us the codec
+FAST_START_PROBE_OPTIONS = '-probesize 32k -analyzeduration 0'
+
 ytdl = youtube_dl.YoutubeDL(ytdl_format_options)
 
+_extraction_cache = None
+
+
+def get_extraction_cache() -> ExtractionCache:
+    # Created on first use, this module is imported before the command line is read
+    global _extraction_cache
+    if _extraction_cache is None:
+        _extraction_cache = ExtractionCache(
+            lambda: youtube_dl.YoutubeDL(ytdl_format_options),
+            max_workers=CLIArgs.ytdl_workers,
+            ttl=CLIArgs.ytdl_cache_ttl,
+        )
+
+    return _extraction_cache
+
+
+def ffmpeg_options_for(data):
+    """The ffmpeg options for a stream, probing as little as possible when its format is known."""
+    acodec = data.get('acodec', None)
+    if not CLIArgs.fast_start or acodec in (None, 'none') or not data.get('ext', None):
+        return ffmpeg_options
+
+    return {
+        'before_options': ffmpeg_options['before_options'].replace(
+            '-probesize 200M', FAST_START_PROBE_OPTIONS),
+        'options': ffmpeg_options['options'],
+    }
+
+
+def ffmpeg_opus_options_for(data, volume, position=0.0):
+    """
+    The ffmpeg options to play a stream as opus, starting `position` seconds in.
+
+    At full volume an opus stream is copied as is, otherwise ffmpeg applies
+    the volume and encodes.
+    """
+    options = dict(ffmpeg_options_for(data))
+    if position > 0:
+        options['before_options'] = f"{options['before_options']} -ss {position:.3f}"
+
+    if volume != 1.0:
+        options['options'] = f"{options['options']} -af volume={volume:.3f}"
+        options['codec'] = None
+    else:
+        options['codec'] = data.get('acodec', None)
+
+    return options
+
+
+def record_time_to_first_audio(source_type, requested_at):
+    time_to_first_audio = time.perf_counter() - requested_at
+    metrics.observe(
+        f"music.time_to_first_audio.{source_type}", time_to_first_audio)
+    logger.debug(
+        f"First audio of {source_type} after {time_to_first_audio * 1000:.0f} ms.")
+
+
+async def extract_stream(url, *, loop=None):
+    loop = loop or asyncio.get_event_loop()
+    data = await get_extraction_cache().extract_info(url, loop=loop)
+    if 'entries' in data:
+        # take first item from a playlist
+        data = data['entries'][0]
+
+    return data
+
+
+def source_type(data):
+    """Where a stream comes from and how it's encoded, e.g. `youtube.opus`."""
+    extractor = data.get('extractor_key', None) or data.get('extractor', None) or 'generic'
+    acodec = data.get('acodec', None) or 'unknown'
+    return f"{extractor}.{acodec}".lower()
+
+
+class PrefetchedAudio(discord.AudioSource):
+    """Hands out a frame read ahead of playback before reading on from `source`."""
+
+    def __init__(self, source):
+        self.source = source
+        self.frame = None
+
+    def prefetch(self):
+        # Blocks until ffmpeg has connected and decoded the first frame
+        self.frame = self.source.read()
+
+    def read(self):
+        if self.frame is not None:
+            frame, self.frame = self.frame, None
+            return frame
+
+        return self.source.read()
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        self.source.cleanup()
+
 
 class YTDLSource(discord.PCMVolumeTransformer):
-    def __init__(self, source, *, data, volume=0.5):
+    def __init__(self, source, *, data, volume=0.5, requested_at=None):
         super().__init__(source, volume)
 
         self.data = data
 
         self.title = data.get('title')
         self.url = data.get('url')
+        self.source_type = source_type(data)
+        # perf_counter() of the request, cleared once the first audio is out
+        self.requested_at = requested_at
+
+    def read(self):
+        frame = super().read()
+        if frame and self.requested_at is not None:
+            record_time_to_first_audio(self.source_type, self.requested_at)
+            self.requested_at = None
+
+        return frame
 
     @classmethod
-    async def from_url(cls, url, *, loop=None, stream=False):
+    async def from_url(cls, url, *, loop=None, stream=False, prewarm=False, volume=0.5, requested_at=None):
+        """
+        :param prewarm: Wait for ffmpeg to decode the first frame, so playback starts without a stall
+        :param requested_at: perf_counter() of the request, to record the time to first audio
+        """
         loop = loop or asyncio.get_event_loop()
-        data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=not stream))
-
-        if 'entries' in data:
-            # take first item from a playlist
-            data = data['entries'][0]
+        if stream:
+            data = await extract_stream(url, loop=loop)
+        else:
+            data = await loop.run_in_executor(None, lambda: ytdl.extract_info(url, download=True))
+            if 'entries' in data:
+                # take first item from a playlist
+                data = data['entries'][0]
 
         filename = data['url'] if stream else ytdl.prepare_filename(data)
-        return cls(discord.FFmpegPCMAudio(filename, **ffmpeg_options), data=data)
+        options = ffmpeg_options_for(data) if stream else ffmpeg_options
+        audio = PrefetchedAudio(discord.FFmpegPCMAudio(filename, **options))
+        if prewarm:
+            try:
+                await loop.run_in_executor(None, audio.prefetch)
+            except BaseException:
+                # Cancelled or failed, ffmpeg is running already
+                audio.cleanup()
+                raise
+
+        return cls(audio, data=data, volume=volume, requested_at=requested_at)
+
+
+class YTDLOpusSource(discord.AudioSource):
+    """
+    Plays a stream as opus packets that go to discord without decoding.
+
+    Volume is an ffmpeg filter, so changing it starts a new ffmpeg at the
+    current position in the background. The old one keeps playing until
+    the new one has caught up, then they're swapped between two packets.
+    A restart waits `VOLUME_DEBOUNCE` seconds first, so dragging the volume
+    only starts one ffmpeg for the value it settles on.
+    """
+
+    VOLUME_DEBOUNCE = 0.25
+
+    def __init__(self, data, *, volume=0.5, requested_at=None):
+        self.data = data
+
+        self.title = data.get('title')
+        self.url = data.get('url')
+        self.source_type = source_type(data)
+        self.requested_at = requested_at
+
+        self.lock = threading.Lock()
+        self._volume = max(volume, 0.0)
+        # Packets handed to the player, 20 ms each
+        self.position = 0
+        # Bumped on every volume change, a restart that's been overtaken is dropped
+        self.generation = 0
+        self.closed = False
+        self.original = self._spawn(self._volume, 0)
+
+    def _spawn(self, volume, position):
+        options = ffmpeg_opus_options_for(
+            self.data, volume, position * discord.opus.Encoder.FRAME_LENGTH / 1000)
+        return PrefetchedAudio(discord.FFmpegOpusAudio(self.url, **options))
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, value):
+        value = max(value, 0.0)
+        with self.lock:
+            if value == self._volume:
+                return
+            self._volume = value
+            self.generation += 1
+            generation = self.generation
+
+        threading.Thread(
+            target=self._restart, args=(generation,),
+            name="opus-volume", daemon=True).start()
+
+    def _restart(self, generation):
+        time.sleep(self.VOLUME_DEBOUNCE)
+        with self.lock:
+            # Overtaken by a newer volume, that one restarts instead
+            if generation != self.generation or self.closed:
+                return
+            volume = self._volume
+            position = self.position
+
+        try:
+            source = self._spawn(volume, position)
+            source.prefetch()
+        except Exception as e:
+            logger.error(f"Could not restart {self.source_type} at volume {volume}: {e}")
+            return
+
+        # The old process played on while the new one started, skip what it played
+        while True:
+            with self.lock:
+                if generation != self.generation or self.closed:
+                    break
+                if position >= self.position:
+                    old, self.original = self.original, source
+                    source = old
+                    break
+            if not source.read():
+                break
+            position += 1
+
+        source.cleanup()
+
+    def read(self):
+        with self.lock:
+            packet = self.original.read()
+            if packet:
+                self.position += 1
+
+        if packet and self.requested_at is not None:
+            record_time_to_first_audio(self.source_type, self.requested_at)
+            self.requested_at = None
+
+        return packet
+
+    def is_opus(self):
+        return True
+
+    def cleanup(self):
+        with self.lock:
+            self.closed = True
+            self.original.cleanup()
+
+    @classmethod
+    async def from_url(cls, url, *, loop=None, prewarm=False, volume=0.5, requested_at=None):
+        loop = loop or asyncio.get_event_loop()
+        data = await extract_stream(url, loop=loop)
+        source = cls(data, volume=volume, requested_at=requested_at)
+        if prewarm:
+            try:
+                await loop.run_in_executor(None, source.original.prefetch)
+            except BaseException:
+                source.cleanup()
+                raise
+
+        return source
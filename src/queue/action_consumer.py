@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import aio_pika
@@ -6,17 +7,72 @@ logger = logging.getLogger(__name__)
 
 
 class ActionConsumer:
-    def __init__(self, connection: aio_pika.Connection, loop, queue_name, action_queue, queue_args):
+    """
+    Puts the messages of a queue on the action queue as `(action, done)`.
+
+    A message is acked once `done` is resolved, after its action was
+    handled, so at most `prefetch_count` of them are unacked at a time and
+    any the bot didn't get to are redelivered after a crash. When `done`
+    resolves with False the action's guild already had as many actions in
+    flight as it may, the message is then requeued after `requeue_delay`
+    seconds so the other guilds' messages get the unacked slots.
+
+    With an exchange the queue is bound to it with `routing_key`, this is
+    how a shard only gets the actions of its own guilds.
+    """
+
+    def __init__(self, connection: aio_pika.Connection, loop, queue_name, action_queue, queue_args, prefetch_count=50,
+                 node_type=None, exchange_name=None, routing_key=None, requeue_delay=0.5):
         self.connection = connection
         self.loop = loop
         self.queue_name = queue_name
+        # The node type of chunk actions, shard queues are named after it but differ
+        self.node_type = node_type or queue_name
         self.action_queue = action_queue
         self.queue_args = queue_args
+        self.prefetch_count = prefetch_count
+        self.exchange_name = exchange_name
+        self.routing_key = routing_key
+        self.requeue_delay = requeue_delay
 
     async def on_message(self, message: aio_pika.IncomingMessage):
-        async with message.process():
-            action = json.loads(message.body)
-            await self.action_queue.put(action)
+        # Acks when the block is left without having nacked
+        async with message.process(ignore_processed=True):
+            headers = message.headers or {}
+            if "stream_id" in headers:
+                action = self.chunk_action(headers, message.body)
+            else:
+                action = json.loads(message.body)
+
+            done = self.loop.create_future()
+            # Waits while the bounded action queue is full
+            await self.action_queue.put((action, done))
+            if not await done:
+                await asyncio.sleep(self.requeue_delay)
+                await message.nack(requeue=True)
+
+    def chunk_action(self, headers, body):
+        """
+        Turn a chunk of a streamed payload into an action.
+
+        The body is the raw chunk, the headers carry `guild_id`, `stream_id`,
+        `seq` (from 0), `final` and `format`.
+        """
+        def header(name, default=None):
+            value = headers.get(name, default)
+            return value.decode() if isinstance(value, bytes) else value
+
+        return {
+            "node_type": self.node_type,
+            "guild_id": int(header("guild_id")),
+            "data": {
+                "stream_id": str(header("stream_id")),
+                "seq": int(header("seq", 0)),
+                "final": str(header("final", False)).lower() in ("true", "1"),
+                "format": header("format", "pcm"),
+                "chunk": body,
+            },
+        }
 
     async def start_consuming(self):
         if not self.connection:
@@ -24,7 +80,12 @@ class ActionConsumer:
             return
 
         channel = await self.connection.channel()
+        await channel.set_qos(prefetch_count=self.prefetch_count)
         queue = await channel.declare_queue(self.queue_name, arguments=self.queue_args)
+        if self.exchange_name:
+            exchange = await channel.declare_exchange(
+                self.exchange_name, aio_pika.ExchangeType.TOPIC, durable=True)
+            await queue.bind(exchange, routing_key=self.routing_key)
 
         await queue.consume(self.on_message)
 
@@ -2,6 +2,7 @@ import logging
 import aio_pika
 
 from src.queue.action_consumer import ActionConsumer
+from src.queue.sharding import ACTIONS_EXCHANGE, routing_key, shard_queue_name
 logger = logging.getLogger(__name__)
 
 
@@ -11,9 +12,18 @@ class ConsumerManager:
         self.connection = rabbit_conn
         self.consumers = []
 
-    async def create_consumer(self, queue_name, action_queue, queue_args=None):
-        consumer = ActionConsumer(
-            self.connection, self.loop, queue_name, action_queue, queue_args)
+    async def create_consumer(self, queue_name, action_queue, queue_args=None, prefetch_count=50, shard_id=None):
+        """
+        Consume the actions of `queue_name`, only those of one shard's guilds if `shard_id` is given.
+        """
+        if shard_id is None:
+            consumer = ActionConsumer(
+                self.connection, self.loop, queue_name, action_queue, queue_args, prefetch_count)
+        else:
+            consumer = ActionConsumer(
+                self.connection, self.loop, shard_queue_name(queue_name, shard_id), action_queue, queue_args,
+                prefetch_count, node_type=queue_name, exchange_name=ACTIONS_EXCHANGE,
+                routing_key=routing_key(queue_name, shard_id))
         self.consumers.append(consumer)
         await consumer.start_consuming()
 
@@ -0,0 +1,20 @@
+ACTIONS_EXCHANGE = "heybilly.actions"
+
+
+def shard_for_guild(guild_id: int, shard_count: int) -> int:
+    """The discord shard a guild is on, see https://discord.com/developers/docs/topics/gateway#sharding"""
+    return (int(guild_id) >> 22) % shard_count
+
+
+def routing_key(queue_name: str, shard_id: int) -> str:
+    """
+    The routing key to publish an action for a shard with, e.g. `music.control.3`.
+
+    Publishers send actions to the `heybilly.actions` topic exchange with
+    the routing key of the guild's shard.
+    """
+    return f"{queue_name}.{shard_id}"
+
+
+def shard_queue_name(queue_name: str, shard_id: int) -> str:
+    return f"{queue_name}.shard-{shard_id}"
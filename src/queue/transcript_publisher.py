@@ -1,26 +1,88 @@
-import json
-import aio_pika
+import asyncio
+import itertools
 import logging
+import time
+
+import aio_pika
+import orjson
+
+from src.utils.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
 
 class TranscriptPublisher:
-    def __init__(self, rabbit_conn: aio_pika.Connection):
+    """
+    Publishes the transcripts of every guild over a small pool of channels.
+
+    `publish_data` only queues a transcript. A background task publishes
+    what's queued in batches, round robin over the channels, and with
+    publisher confirms waits for the broker to confirm the whole batch at
+    once. The time from queueing to publishing (or confirming) is recorded
+    as `transcripts.publish`.
+
+    :param pool_size: The amount of channels to publish on
+    :param confirms: Wait for the broker to confirm every transcript
+    :param batch_size: Transcripts published at most at once
+    """
+
+    def __init__(self, rabbit_conn: aio_pika.Connection, pool_size=2, confirms=False, batch_size=64):
         self.connection = rabbit_conn
-        self.channel = None
-        self.queue = None
+        self.pool_size = pool_size
+        self.confirms = confirms
+        self.batch_size = batch_size
+        self.channels = []
+        self.next_channel = None
         self.queue_name = f"process_guild_transcripts.requests"
-        self.exchange = None
+        self.pending = asyncio.Queue()
+        self.publish_task = None
 
     async def setup_connection(self):
-        self.channel = await self.connection.channel()
-        self.queue = await self.channel.declare_queue(self.queue_name)
-        self.exchange = self.channel.default_exchange
+        for _ in range(self.pool_size):
+            channel = await self.connection.channel(publisher_confirms=self.confirms)
+            self.channels.append(channel)
+        self.next_channel = itertools.cycle(self.channels)
 
-    async def publish_data(self, data):
+        await self.channels[0].declare_queue(self.queue_name)
+        self.publish_task = asyncio.create_task(self.publish_pending())
+
+    async def publish_data(self, data: dict):
+        """Queue `data` to be published as JSON, returns without waiting for it."""
         logger.debug(f"Publishing transcript: {data}")
-        await self.exchange.publish(
-            aio_pika.Message(body=data.encode()),
-            routing_key=self.queue_name
-        )
+        self.pending.put_nowait((orjson.dumps(data), time.perf_counter()))
+
+    async def _publish(self, body, queued_at):
+        channel = next(self.next_channel)
+        try:
+            await channel.default_exchange.publish(
+                aio_pika.Message(body=body, content_type="application/json"),
+                routing_key=self.queue_name
+            )
+            metrics.increment("transcripts.published")
+            metrics.observe("transcripts.publish", time.perf_counter() - queued_at)
+        except Exception as e:
+            metrics.increment("transcripts.failed")
+            logger.error(f"Error publishing transcript: {e}")
+
+    async def publish_pending(self):
+        while True:
+            batch = [await self.pending.get()]
+            while len(batch) < self.batch_size and not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+
+            logger.debug(f"Publishing {len(batch)} transcripts.")
+            await asyncio.gather(*(self._publish(body, queued_at) for body, queued_at in batch))
+            for _ in batch:
+                self.pending.task_done()
+
+    async def close(self, timeout=5.0):
+        """Publish what's still queued, for at most `timeout` seconds, then close the channels."""
+        if self.publish_task:
+            try:
+                await asyncio.wait_for(self.pending.join(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Closing with {self.pending.qsize()} transcripts still queued.")
+            self.publish_task.cancel()
+
+        for channel in self.channels:
+            await channel.close()
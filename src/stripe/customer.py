@@ -39,13 +39,17 @@ class StripeCustomer:
         else:
             return None
 
+    @staticmethod
+    def has_active_subscription(customer_id: str):
+        response = stripe.Subscription.list(
+            customer=customer_id, status="active")
+
+        return len(response.data) > 0
+
     @staticmethod
     def has_active_plan(guild_id: str):
         customer_id = StripeCustomer.get_customer_id_for_guild_id(guild_id)
         if not customer_id:
             return False
 
-        response = stripe.Subscription.list(
-            customer=customer_id, status="active")
-
-        return len(response.data) > 0
+        return StripeCustomer.has_active_subscription(customer_id)
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.stripe.customer import StripeCustomer
+from src.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# The PostgREST error when a query embeds tables without a foreign key between them
+MISSING_RELATIONSHIP = "PGRST200"
+
+
+class EntitlementCache:
+    """
+    Answers whether a guild has an active plan without blocking the event loop.
+
+    The lookups (supabase, then Stripe) run on a thread pool of their own.
+    Answers are cached per guild, guilds without a plan for a shorter time
+    so they can subscribe and start using the bot soon after. Concurrent
+    checks of one guild share a single lookup. `invalidate` drops cached
+    answers, e.g. when a Stripe webhook reports a subscription change.
+
+    :param ttl: Seconds an active plan is cached
+    :param negative_ttl: Seconds a missing plan is cached
+    :param max_workers: Lookups that may run at once
+    """
+
+    def __init__(self, supabase, ttl=300, negative_ttl=60, max_workers=4):
+        self.supabase = supabase
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="entitlements")
+        # guild id -> (expires at, has plan)
+        self.entries = {}
+        self.in_flight = SingleFlight()
+        # guild id -> times invalidated, a lookup that was overtaken isn't cached
+        self.generations = {}
+        # stripe customer id -> guild ids, to invalidate by customer
+        self.customer_guilds = {}
+        # Cleared when the database has no relationship to join over
+        self.use_join = True
+
+    def get_customer_id_for_guild_id(self, guild_id):
+        """The guild's stripe customer id in one query, joined over the owner's profile."""
+        if self.use_join:
+            try:
+                response = self.supabase.table("guild_settings")\
+                    .select("profiles(stripe_customers(stripe_customer_id))")\
+                    .eq("guild_id", str(guild_id))\
+                    .execute()
+            except Exception as e:
+                # Anything but a missing relationship may pass, don't give up on the join for it
+                if getattr(e, "code", None) != MISSING_RELATIONSHIP:
+                    raise
+                logger.warning(
+                    f"Joined customer lookup failed, falling back to separate queries: {e}")
+                self.use_join = False
+            else:
+                data = response.data
+                if not data:
+                    return None
+
+                customers = (data[0].get("profiles", None) or {}).get("stripe_customers", None)
+                if isinstance(customers, list):
+                    customers = customers[0] if customers else None
+                return (customers or {}).get("stripe_customer_id", None)
+
+        return StripeCustomer.get_customer_id_for_guild_id(guild_id)
+
+    def _lookup(self, guild_id):
+        customer_id = self.get_customer_id_for_guild_id(guild_id)
+        if not customer_id:
+            return None, False
+
+        return customer_id, StripeCustomer.has_active_subscription(customer_id)
+
+    def _store(self, guild_id, customer_id, has_plan):
+        ttl = self.ttl if has_plan else self.negative_ttl
+        self.entries[guild_id] = (time.monotonic() + ttl, has_plan)
+        if customer_id:
+            self.customer_guilds.setdefault(customer_id, set()).add(guild_id)
+
+    async def has_active_plan(self, guild_id) -> bool:
+        entry = self.entries.get(guild_id, None)
+        if entry is not None:
+            expires_at, has_plan = entry
+            if expires_at > time.monotonic():
+                return has_plan
+            del self.entries[guild_id]
+
+        async def lookup():
+            generation = self.generations.get(guild_id, 0)
+            customer_id, has_plan = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self._lookup, guild_id)
+            # An invalidation during the lookup may have made the answer stale
+            if self.generations.get(guild_id, 0) == generation:
+                self._store(guild_id, customer_id, has_plan)
+            return has_plan
+
+        return await self.in_flight.do(guild_id, lookup)
+
+    def invalidate(self, guild_id=None, customer_id=None):
+        """Forget the cached answer of a guild, or of every guild of a stripe customer."""
+        guild_ids = set()
+        if guild_id is not None:
+            guild_ids.add(guild_id)
+        if customer_id is not None:
+            guild_ids |= self.customer_guilds.pop(customer_id, set())
+
+        for guild_id in guild_ids:
+            self.entries.pop(guild_id, None)
+            self.generations[guild_id] = self.generations.get(guild_id, 0) + 1
+            self.in_flight.forget(guild_id)
+            logger.debug(f"Invalidated entitlement of guild {guild_id}.")
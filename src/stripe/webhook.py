@@ -0,0 +1,68 @@
+import logging
+import os
+
+import stripe
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+
+# Events after which a customer's plan may have changed
+SUBSCRIPTION_EVENTS = (
+    "customer.subscription.created",
+    "customer.subscription.updated",
+    "customer.subscription.deleted",
+    "customer.subscription.paused",
+    "customer.subscription.resumed",
+)
+
+
+class StripeWebhookServer:
+    """
+    Receives Stripe webhooks to invalidate cached entitlements right away.
+
+    A stand-in for a real webhook endpoint: it only listens for
+    subscription events and, when `STRIPE_WEBHOOK_SECRET` is set, checks
+    their signature. Without it, e.g. with `stripe listen` forwarding
+    locally, events are taken as they are.
+
+    :param entitlements: The EntitlementCache to invalidate
+    """
+
+    def __init__(self, entitlements, host="127.0.0.1", port=8787):
+        self.entitlements = entitlements
+        self.host = host
+        self.port = port
+        self.runner = None
+
+    async def handle(self, request: web.Request):
+        payload = await request.read()
+        try:
+            if STRIPE_WEBHOOK_SECRET:
+                event = stripe.Webhook.construct_event(
+                    payload, request.headers.get("Stripe-Signature", ""), STRIPE_WEBHOOK_SECRET)
+            else:
+                event = stripe.Event.construct_from(await request.json(), stripe.api_key)
+        except (ValueError, stripe.error.SignatureVerificationError) as e:
+            logger.warning(f"Rejected Stripe webhook: {e}")
+            return web.Response(status=400)
+
+        if event["type"] in SUBSCRIPTION_EVENTS:
+            customer_id = event["data"]["object"]["customer"]
+            logger.debug(f"Stripe {event['type']} for customer {customer_id}.")
+            self.entitlements.invalidate(customer_id=customer_id)
+
+        return web.Response(status=200)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/stripe/webhook", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        logger.info(f"Listening for Stripe webhooks on {self.host}:{self.port}.")
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
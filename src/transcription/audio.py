@@ -0,0 +1,36 @@
+import numpy as np
+
+# Whisper models expect mono audio at this rate
+SAMPLING_RATE = 16000
+
+
+def pcm_to_float32(pcm: bytes, sampling_rate: int, channels: int) -> np.ndarray:
+    """
+    Convert interleaved signed 16 bit PCM to mono float32 audio at 16 kHz.
+
+    The bytes are viewed in place, the only copies are the downmix and the
+    resample.
+    :param pcm: Raw little endian PCM, as produced by the discord decoder
+    :param sampling_rate: The sampling rate of `pcm`
+    :param channels: The amount of interleaved channels in `pcm`
+    :return: Samples in the [-1, 1) range
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16, count=len(pcm) // 2)
+    frames = len(samples) // channels
+    samples = samples[:frames * channels].reshape(frames, channels)
+
+    audio = samples.mean(axis=1, dtype=np.float32)
+    audio *= 1 / 32768
+
+    if sampling_rate == SAMPLING_RATE:
+        return audio
+
+    if sampling_rate % SAMPLING_RATE == 0:
+        # Average every `factor` samples, a box filter is enough for speech
+        factor = sampling_rate // SAMPLING_RATE
+        length = len(audio) // factor
+        return audio[:length * factor].reshape(length, factor).mean(axis=1)
+
+    length = int(len(audio) * SAMPLING_RATE / sampling_rate)
+    positions = np.arange(length) * (sampling_rate / SAMPLING_RATE)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
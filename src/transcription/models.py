@@ -0,0 +1,110 @@
+import logging
+import threading
+
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+
+from src.config.cliargs import CLIArgs
+
+logger = logging.getLogger(__name__)
+
+INITIAL_PROMPT = "Hey Billy, Okay Billy, and Yo Billy are all wake words for a smart assistant. You're job is to transcribe their resquest as a full sentence. Keywords: GIFs, videos, music, YouTube, Yeat, Discord, play, volume, resume, pause, stop."
+
+WAKE_WORD_PROMPT = "Hey Billy. Okay Billy. Yo Billy."
+
+# Decoding settings, every job submitted to the scheduler names one of these.
+# A `<profile>_model` attribute on CLIArgs overrides the model and
+# `CLIArgs.decode_options` is merged into the options.
+DECODE_PROFILES = {
+    # Partials only drive endpointing, they need to be fast and stream
+    "partial": {
+        "model": "base.en",
+        "options": dict(
+            beam_size=1,
+            best_of=1,
+            temperature=0,
+            no_speech_threshold=0.6,
+            word_timestamps=True,
+            initial_prompt=INITIAL_PROMPT,
+        ),
+    },
+    # Runs once per phrase, this is the transcript that gets published
+    "final": {
+        "model": "medium.en",
+        "options": dict(
+            beam_size=10,
+            best_of=3,
+            no_speech_threshold=0.6,
+            initial_prompt=INITIAL_PROMPT,
+        ),
+    },
+    # Keyword spotting in front of the expensive model, only the text matters
+    "wake": {
+        "model": "tiny.en",
+        "options": dict(
+            beam_size=1,
+            best_of=1,
+            temperature=0,
+            condition_on_previous_text=False,
+            initial_prompt=WAKE_WORD_PROMPT,
+        ),
+    },
+}
+
+_models = {}
+_pipelines = {}
+_models_lock = threading.Lock()
+
+
+def profile_model(profile: str):
+    """The model a decode profile runs on, None if the wake profile is disabled."""
+    override = getattr(CLIArgs, f"{profile}_model", "")
+    if override is None or override == "None":
+        if profile != "wake":
+            raise ValueError(f"The {profile} profile needs a model")
+        return None
+
+    return override or DECODE_PROFILES[profile]["model"]
+
+
+def profile_options(profile: str) -> dict:
+    overrides = (CLIArgs.decode_options or {}).get(profile, {})
+    return {**DECODE_PROFILES[profile]["options"], **overrides}
+
+
+def load_model(name: str, compute_type=None, cpu_threads=None, num_workers=None) -> WhisperModel:
+    """Load a model, settings left as None come from the command line."""
+    compute_type = compute_type or CLIArgs.whisper_compute_type
+    cpu_threads = CLIArgs.whisper_cpu_threads if cpu_threads is None else cpu_threads
+    num_workers = num_workers or CLIArgs.whisper_num_workers
+
+    logger.info(
+        f"Loading whisper model {name} ({compute_type}, {cpu_threads} threads, {num_workers} workers).")
+    return WhisperModel(
+        name,
+        device="cpu",
+        compute_type=compute_type,
+        cpu_threads=cpu_threads,
+        num_workers=num_workers,
+    )
+
+
+def get_model(name: str) -> WhisperModel:
+    """Load a model once and share it with every guild."""
+    with _models_lock:
+        model = _models.get(name, None)
+        if model is None:
+            model = load_model(name)
+            _models[name] = model
+
+        return model
+
+
+def get_batched_pipeline(name: str) -> BatchedInferencePipeline:
+    model = get_model(name)
+    with _models_lock:
+        pipeline = _pipelines.get(name, None)
+        if pipeline is None:
+            pipeline = BatchedInferencePipeline(model=model)
+            _pipelines[name] = pipeline
+
+        return pipeline
@@ -0,0 +1,275 @@
+import bisect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+from src.config.cliargs import CLIArgs
+from src.transcription.audio import SAMPLING_RATE
+from src.transcription.models import (DECODE_PROFILES, get_batched_pipeline,
+                                      get_model, profile_model,
+                                      profile_options)
+from src.transcription.streaming import Word
+
+logger = logging.getLogger(__name__)
+
+# The batched pipeline decodes every clip as a single 30 second chunk
+MAX_CLIP_SAMPLES = 30 * SAMPLING_RATE
+
+
+class InferenceJob:
+    def __init__(self, guild_id, key, audio, profile, deadline, expire):
+        self.guild_id = guild_id
+        self.key = key
+        self.audio = audio[-MAX_CLIP_SAMPLES:]
+        self.profile = profile
+        self.deadline = deadline
+        self.expire = expire
+        self.future = Future()
+
+    def resolve(self, result):
+        if not self.future.done():
+            self.future.set_result(result)
+
+
+class InferenceScheduler:
+    """
+    Shares the whisper models between every sink in the process.
+
+    Sinks submit speaker windows and get a future back. Pending windows from
+    all guilds are decoded together in a single batched call. Guilds take
+    turns filling a batch, so a busy guild can't starve the others, and
+    windows that miss their deadline resolve to None instead of delaying
+    fresher audio.
+
+    :param batch_size: The maximum amount of windows decoded in one call
+    :param workers: The amount of threads running batches at the same time
+    :param deadline: Default seconds a window may wait before it's dropped
+    :param linger: Seconds to wait for more windows before decoding a batch that isn't full
+    """
+
+    def __init__(self, batch_size=8, workers=1, deadline=2.0, linger=0.01):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.deadline = deadline
+        self.linger = linger
+
+        # guild_id -> {key: InferenceJob}, the order is the round-robin order
+        self.guild_jobs = OrderedDict()
+        self.condition = threading.Condition()
+        self.running = False
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(
+                target=self._run, name=f"inference-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+        for thread in self.threads:
+            thread.join()
+        self.threads.clear()
+
+    def submit(self, guild_id, key, audio: np.ndarray, profile="partial", deadline=None, expire=True) -> Future:
+        """
+        Queue a window for decoding.
+
+        :param guild_id: The guild the window belongs to, used for fair share
+        :param key: Identifies the speaker, a newer window replaces a pending one with the same key
+        :param audio: Mono float32 audio at 16 kHz
+        :param profile: A key of `DECODE_PROFILES` that isn't disabled
+        :param deadline: Seconds the window may wait, None uses the scheduler default
+        :param expire: Drop the window once its deadline passed, otherwise the deadline only orders it
+        :return: A future resolving to a list of words, or None if the window was dropped
+        """
+        if deadline is None:
+            deadline = self.deadline
+
+        job = InferenceJob(guild_id, key, audio, profile,
+                           time.monotonic() + deadline, expire)
+
+        with self.condition:
+            jobs = self.guild_jobs.setdefault(guild_id, {})
+            previous = jobs.pop(key, None)
+            if previous:
+                previous.resolve(None)
+
+            jobs[key] = job
+            self.condition.notify()
+
+        return job.future
+
+    def _expire(self, now):
+        for guild_id in list(self.guild_jobs):
+            jobs = self.guild_jobs[guild_id]
+            for key in [key for key, job in jobs.items() if job.expire and job.deadline < now]:
+                logger.debug(
+                    f"Dropping window for {key} in guild {guild_id}, deadline missed.")
+                jobs.pop(key).resolve(None)
+
+            if not jobs:
+                del self.guild_jobs[guild_id]
+
+    def _pending(self):
+        return sum(len(jobs) for jobs in self.guild_jobs.values())
+
+    def _take_batch(self):
+        self._expire(time.monotonic())
+        if not self.guild_jobs:
+            return []
+
+        # The most urgent window of any guild picks the profile, the rotation
+        # only decides who shares the batch with it
+        profile = min(
+            (job for jobs in self.guild_jobs.values() for job in jobs.values()),
+            key=lambda j: j.deadline,
+        ).profile
+
+        batch = []
+        while len(batch) < self.batch_size:
+            taken = False
+            for guild_id in list(self.guild_jobs):
+                if len(batch) >= self.batch_size:
+                    break
+
+                jobs = self.guild_jobs[guild_id]
+                candidates = [j for j in jobs.values() if j.profile == profile]
+                if not candidates:
+                    continue
+
+                # Earliest deadline first within a guild
+                job = min(candidates, key=lambda j: j.deadline)
+                del jobs[job.key]
+                if jobs:
+                    self.guild_jobs.move_to_end(guild_id)
+                else:
+                    del self.guild_jobs[guild_id]
+
+                batch.append(job)
+                taken = True
+
+            if not taken:
+                break
+
+        return batch
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.guild_jobs:
+                    self.condition.wait()
+
+                if not self.running:
+                    break
+
+                if self._pending() < self.batch_size and self.linger > 0:
+                    self.condition.wait(self.linger)
+
+                batch = self._take_batch()
+
+            if not batch:
+                continue
+
+            try:
+                results = self._decode(batch)
+            except Exception as e:
+                logger.error(f"Error transcribing audio: {e}")
+                results = [None] * len(batch)
+
+            for job, result in zip(batch, results):
+                job.resolve(result)
+
+        with self.condition:
+            for jobs in self.guild_jobs.values():
+                for job in jobs.values():
+                    job.resolve(None)
+            self.guild_jobs.clear()
+
+    def _decode(self, batch):
+        model = profile_model(batch[0].profile)
+        options = profile_options(batch[0].profile)
+
+        if len(batch) == 1:
+            segments, info = get_model(model).transcribe(
+                batch[0].audio,
+                # Sinks only submit audio their own VAD already accepted
+                vad_filter=False,
+                **options,
+            )
+
+            return [[
+                word for segment in segments
+                for word in _segment_words(segment, 0)
+            ]]
+
+        # Lay the windows out back to back and let the pipeline decode each
+        # one as its own clip in a single batch.
+        starts = []
+        clips = []
+        offset = 0
+        for job in batch:
+            duration = len(job.audio) / SAMPLING_RATE
+            starts.append(offset)
+            clips.append({"start": offset, "end": offset + duration})
+            offset += duration
+
+        audio = np.concatenate([job.audio for job in batch])
+        segments, info = get_batched_pipeline(model).transcribe(
+            audio,
+            clip_timestamps=clips,
+            batch_size=len(batch),
+            vad_filter=False,
+            **options,
+        )
+
+        results = [[] for _ in batch]
+        for segment in segments:
+            index = bisect.bisect_right(
+                starts, (segment.start + segment.end) / 2) - 1
+            index = max(0, index)
+            results[index].extend(_segment_words(segment, starts[index]))
+
+        return results
+
+
+def _segment_words(segment, offset):
+    # Profiles without word timestamps get one entry per segment
+    if not segment.words:
+        return [Word(segment.start - offset, segment.end - offset, segment.text)]
+
+    return [
+        Word(word.start - offset, word.end - offset, word.word)
+        for word in segment.words
+    ]
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_inference_scheduler() -> InferenceScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            for profile in DECODE_PROFILES:
+                model = profile_model(profile)
+                if model:
+                    get_model(model)
+
+            _scheduler = InferenceScheduler(
+                batch_size=CLIArgs.inference_batch_size,
+                workers=CLIArgs.whisper_num_workers,
+            )
+            _scheduler.start()
+
+        return _scheduler
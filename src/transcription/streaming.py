@@ -0,0 +1,81 @@
+import re
+from collections import namedtuple
+
+Word = namedtuple("Word", ["start", "end", "text"])
+
+
+def _normalize(text):
+    return re.sub(r"[^a-z0-9']", "", text.lower())
+
+
+class LocalAgreement:
+    """
+    Tracks a streaming transcription for a single speaker.
+
+    Words that two consecutive hypotheses agree on are committed, so the audio
+    behind them can be dropped and only the uncommitted tail has to be decoded
+    on the next tick.
+
+    :param min_tail: Seconds at the end of the window that are never committed, the model is least stable there
+    :param max_window: Commit the current hypothesis even without agreement once the window grows past this many seconds
+    """
+
+    def __init__(self, min_tail=1.0, max_window=10.0):
+        self.min_tail = min_tail
+        self.max_window = max_window
+
+        self.committed = []
+        # Last hypothesis, timestamps are relative to the start of the window
+        self.hypothesis = []
+
+    def text(self):
+        committed = "".join(self.committed)
+        tail = "".join(word.text for word in self.hypothesis)
+        return (committed + tail).strip()
+
+    def update(self, words, window_duration):
+        """
+        Feed a new hypothesis for the current window.
+
+        :param words: The words of the hypothesis with timestamps relative to the window start
+        :param window_duration: Length of the decoded window in seconds
+        :return: How many seconds can be dropped from the start of the window
+        """
+        limit = window_duration - self.min_tail
+
+        if window_duration > self.max_window:
+            # Nobody stops talking for the model, bound the window anyway
+            agreed = len(words)
+        else:
+            agreed = 0
+            for new, old in zip(words, self.hypothesis):
+                if _normalize(new.text) != _normalize(old.text):
+                    break
+                agreed += 1
+
+        commit = []
+        for word in words[:agreed]:
+            if word.end > limit:
+                break
+            commit.append(word)
+
+        if not commit:
+            self.hypothesis = list(words)
+            if not words and window_duration > self.max_window:
+                # Nothing but noise in a long window
+                return max(0, limit)
+            return 0
+
+        cut = commit[-1].end
+        self.committed.extend(word.text for word in commit)
+        self.hypothesis = [
+            Word(word.start - cut, word.end - cut, word.text)
+            for word in words[len(commit):]
+        ]
+
+        return cut
+
+    def commit_all(self):
+        """Commit the current hypothesis, the caller drops the window audio."""
+        self.committed.extend(word.text for word in self.hypothesis)
+        self.hypothesis = []
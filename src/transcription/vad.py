@@ -0,0 +1,77 @@
+import numpy as np
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from src.transcription.audio import SAMPLING_RATE
+
+FRAME_SAMPLES = SAMPLING_RATE // 50  # 20 ms, one discord packet
+
+
+class StreamingVAD:
+    """
+    Cheap voice activity detection for a single speaker's incoming audio.
+
+    Frames are first gated on energy against an adaptive noise floor, which
+    rejects the near silent frames of an open mic for the cost of an RMS.
+    Audio that passes is confirmed with the Silero model bundled with
+    faster-whisper, so keyboard clatter and breathing don't count as speech.
+
+    :param energy_margin_db: How far above the noise floor a frame must be to be considered
+    :param min_energy_db: Frames quieter than this are never speech
+    :param silero_threshold: Speech probability Silero must report, None skips the Silero check
+    :param context: Seconds of previous audio given to Silero along with the new audio
+    """
+
+    def __init__(self, energy_margin_db=10, min_energy_db=-50, silero_threshold=0.5, context=0.3):
+        self.energy_margin_db = energy_margin_db
+        self.min_energy_db = min_energy_db
+        self.silero_threshold = silero_threshold
+        self.context_samples = int(context * SAMPLING_RATE)
+
+        self.noise_floor_db = min_energy_db
+        self.context = np.zeros(0, dtype=np.float32)
+
+    def _frame_energy_db(self, audio):
+        frames = len(audio) // FRAME_SAMPLES
+        if frames == 0:
+            frames = 1
+            audio = np.pad(audio, (0, FRAME_SAMPLES - len(audio)))
+
+        framed = audio[:frames * FRAME_SAMPLES].reshape(frames, FRAME_SAMPLES)
+        rms = np.sqrt(np.mean(np.square(framed), axis=1))
+        return 20 * np.log10(rms + 1e-10)
+
+    def is_speech(self, audio: np.ndarray) -> bool:
+        """
+        Feed the audio that arrived since the last call.
+
+        :param audio: Mono float32 audio at 16 kHz
+        :return: True if anything speech-like is in `audio`
+        """
+        if len(audio) == 0:
+            return False
+
+        energy = self._frame_energy_db(audio)
+        loud = energy > max(self.min_energy_db,
+                            self.noise_floor_db + self.energy_margin_db)
+
+        quiet = energy[~loud]
+        if len(quiet):
+            # Follow the noise floor slowly so a long sentence doesn't raise it
+            self.noise_floor_db = 0.9 * self.noise_floor_db + \
+                0.1 * float(np.median(quiet))
+
+        speech = bool(loud.any())
+        if speech and self.silero_threshold is not None:
+            window = np.concatenate([self.context, audio])
+            timestamps = get_speech_timestamps(window, VadOptions(
+                threshold=self.silero_threshold,
+                min_speech_duration_ms=60,
+                min_silence_duration_ms=100,
+                speech_pad_ms=0,
+            ))
+            speech = any(t["end"] > len(self.context) for t in timestamps)
+
+        self.context = np.concatenate(
+            [self.context, audio])[-self.context_samples:]
+
+        return speech
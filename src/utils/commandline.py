@@ -1,4 +1,5 @@
 import argparse
+import json
 
 
 class CommandLine:
@@ -19,6 +20,10 @@ class CommandLine:
     def _optional_float(string):
         return None if string == "None" else float(string)
 
+    @staticmethod
+    def _optional_json(string):
+        return None if string == "None" else json.loads(string)
+
     @classmethod
     def update_from_args(cls, args):
         for key, value in vars(args).items():
@@ -38,4 +43,230 @@ class CommandLine:
             help="Enable verbose logging"
         )
 
-        return parser.parse_args()
+        parser.add_argument(
+            "--partial-model",
+            type=str,
+            default="base.en",
+            help="Fast whisper model for the partial transcripts that decide when a phrase is done"
+        )
+
+        parser.add_argument(
+            "--final-model",
+            type=str,
+            default="medium.en",
+            help="Accurate whisper model that decodes every finished phrase once"
+        )
+
+        parser.add_argument(
+            "--wake-model",
+            type=str,
+            default="tiny.en",
+            help="Whisper model that spots the wake word before the full model runs, None transcribes everything"
+        )
+
+        parser.add_argument(
+            "--wake-word-lookback",
+            type=float,
+            default=3.0,
+            help="Seconds of audio before the wake word was spotted that are still transcribed"
+        )
+
+        parser.add_argument(
+            "--decode-options",
+            type=CommandLine()._optional_json,
+            default=None,
+            help='JSON overrides for the decoding profiles, e.g. \'{"final": {"beam_size": 5}}\''
+        )
+
+        parser.add_argument(
+            "--whisper-compute-type",
+            type=str,
+            default="float32",
+            help="CTranslate2 compute type of the whisper models, e.g. int8, int8_float32 or float32"
+        )
+
+        parser.add_argument(
+            "--whisper-cpu-threads",
+            type=int,
+            default=0,
+            help="Threads each whisper model may use, 0 lets CTranslate2 decide"
+        )
+
+        parser.add_argument(
+            "--whisper-num-workers",
+            type=int,
+            default=1,
+            help="Whisper calls that may run in parallel, also the amount of inference scheduler threads"
+        )
+
+        parser.add_argument(
+            "--inference-batch-size",
+            type=int,
+            default=8,
+            help="Maximum amount of speaker windows decoded in one batch"
+        )
+
+        parser.add_argument(
+            "--decode-for-speech",
+            type=CommandLine()._str2bool,
+            default=False,
+            help="Decode voice straight to mono 16 kHz and only for transcribed speakers, replaces py-cord's decoder lookup"
+        )
+
+        parser.add_argument(
+            "--audio-cache-dir",
+            type=str,
+            default=".cache/audio",
+            help="Directory for decoded sound effects and TTS clips"
+        )
+
+        parser.add_argument(
+            "--audio-cache-size-mb",
+            type=int,
+            default=512,
+            help="Size limit of the audio cache, least recently played clips are evicted first"
+        )
+
+        parser.add_argument(
+            "--ytdl-workers",
+            type=int,
+            default=4,
+            help="yt-dlp extractions that may run at once"
+        )
+
+        parser.add_argument(
+            "--ytdl-cache-ttl",
+            type=int,
+            default=3600,
+            help="Seconds extracted metadata is reused, less if the stream URL expires sooner"
+        )
+
+        parser.add_argument(
+            "--fast-start",
+            type=CommandLine()._str2bool,
+            default=True,
+            help="Probe streams of a known format briefly instead of reading up to 200M first"
+        )
+
+        parser.add_argument(
+            "--music-playback-mode",
+            type=str,
+            choices=["pcm", "opus"],
+            default="pcm",
+            help="Decode music and scale the volume in the bot (pcm), or pass opus through and let ffmpeg apply the volume (opus)"
+        )
+
+        parser.add_argument(
+            "--audio-mixer",
+            type=CommandLine()._str2bool,
+            default=True,
+            help="Mix music, sound effects and TTS instead of pausing the music for them (pcm playback only)"
+        )
+
+        parser.add_argument(
+            "--duck-gain",
+            type=float,
+            default=0.35,
+            help="Music volume multiplier while TTS plays over it"
+        )
+
+        parser.add_argument(
+            "--prefetch-count",
+            type=int,
+            default=50,
+            help="Unacked messages RabbitMQ delivers per action queue, unless the queue sets its own"
+        )
+
+        parser.add_argument(
+            "--action-queue-size",
+            type=int,
+            default=100,
+            help="Actions buffered in the bot before consumers wait"
+        )
+
+        parser.add_argument(
+            "--guild-actions-in-flight",
+            type=int,
+            default=16,
+            help="Unhandled actions a guild may have before its further messages are requeued"
+        )
+
+        parser.add_argument(
+            "--shard-id",
+            type=int,
+            default=None,
+            help="The discord shard this process runs, it only consumes the actions of that shard's guilds"
+        )
+
+        parser.add_argument(
+            "--shard-count",
+            type=int,
+            default=None,
+            help="The amount of shards, one bot process runs each"
+        )
+
+        parser.add_argument(
+            "--publisher-channels",
+            type=int,
+            default=2,
+            help="Channels the transcripts of all guilds are published on"
+        )
+
+        parser.add_argument(
+            "--publisher-confirms",
+            type=CommandLine()._str2bool,
+            default=False,
+            help="Have RabbitMQ confirm every published transcript"
+        )
+
+        parser.add_argument(
+            "--entitlement-ttl",
+            type=int,
+            default=300,
+            help="Seconds an active plan is cached per guild"
+        )
+
+        parser.add_argument(
+            "--entitlement-negative-ttl",
+            type=int,
+            default=60,
+            help="Seconds a missing plan is cached per guild"
+        )
+
+        parser.add_argument(
+            "--stripe-webhook-port",
+            type=int,
+            default=None,
+            help="Listen for Stripe subscription webhooks on this port to drop cached plans right away"
+        )
+
+        parser.add_argument(
+            "--nickname-debounce",
+            type=float,
+            default=0.25,
+            help="Seconds a status waits for a newer one before the nickname is changed"
+        )
+
+        parser.add_argument(
+            "--nickname-min-interval",
+            type=float,
+            default=1.0,
+            help="Seconds between two nickname changes in a guild at least"
+        )
+
+        parser.add_argument(
+            "--metrics-interval",
+            type=float,
+            default=60,
+            help="Seconds between metrics snapshots in the debug log, 0 to turn them off"
+        )
+
+        args = parser.parse_args()
+        if (args.shard_id is None) != (args.shard_count is None):
+            parser.error("--shard-id and --shard-count go together")
+        # Only the wake word check can be turned off, the others have no fallback
+        for flag in ("partial_model", "final_model"):
+            if getattr(args, flag) == "None":
+                parser.error(f"--{flag.replace('_', '-')} needs a model name")
+
+        return args
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Keeps the latest observations of a value to report percentiles."""
+
+    def __init__(self, size=1024):
+        self.values = deque(maxlen=size)
+        self.count = 0
+
+    def observe(self, value):
+        self.values.append(value)
+        self.count += 1
+
+    def percentile(self, fraction):
+        if not self.values:
+            return None
+
+        values = sorted(self.values)
+        return values[min(len(values) - 1, round(fraction * (len(values) - 1)))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+        }
+
+
+class Metrics:
+    """Process wide counters, gauges and histograms, safe to use from any thread."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        self.histograms = defaultdict(Histogram)
+
+    def increment(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+    async def log_every(self, interval):
+        """Log a snapshot at debug level every `interval` seconds, until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            logger.debug(f"Metrics: {self.snapshot()}")
+
+
+metrics = Metrics()
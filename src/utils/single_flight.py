@@ -0,0 +1,50 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Runs one load per key at a time, concurrent callers of a key share its result.
+
+    The first caller of a key runs the load, the others wait for it and get
+    the same result or exception. If the first caller is cancelled, so are
+    the ones waiting on it.
+    """
+
+    def __init__(self):
+        # key -> asyncio.Future of a load in progress
+        self.in_flight = {}
+
+    def __contains__(self, key):
+        return key in self.in_flight
+
+    async def do(self, key, load):
+        """
+        Return the result of `await load()`, shared with concurrent calls for `key`.
+
+        :param load: Coroutine function that's awaited if no load of `key` is in progress
+        """
+        in_flight = self.in_flight.get(key, None)
+        if in_flight is not None:
+            return await asyncio.shield(in_flight)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            result = await load()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            # Mark it retrieved, the waiters re-raise it themselves
+            future.exception()
+            raise
+        finally:
+            # Cancelled itself, don't leave the waiters hanging
+            if not future.done():
+                future.cancel()
+            if self.in_flight.get(key, None) is future:
+                del self.in_flight[key]
+
+    def forget(self, key):
+        """Have the next call for `key` start a new load, the one in progress still answers its waiters."""
+        self.in_flight.pop(key, None)
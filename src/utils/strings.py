@@ -1,5 +1,7 @@
 import re
 
+WAKE_WORDS = ["ok billy", "yo billy", "okay billy", "hey billy"]
+
 
 def find_wake_word_start(wake_words, line):
     normalized_line = line.lower()
@@ -11,3 +13,27 @@ def find_wake_word_start(wake_words, line):
         return -1
 
     return min(pos for pos in wake_word_positions if pos >= 0)
+
+
+def normalize_words(line):
+    normalized_line = re.sub(r"[^a-z0-9' ]", " ", line.lower())
+    return normalized_line.split()
+
+
+def word_error_rate(reference, hypothesis):
+    """Word level edit distance between two lines, divided by the reference length."""
+    reference = normalize_words(reference)
+    hypothesis = normalize_words(hypothesis)
+
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, start=1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, start=1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word),
+            ))
+        previous = current
+
+    return previous[-1] / max(1, len(reference))
@@ -0,0 +1,84 @@
+import asyncio
+
+from src.bot.action_lanes import ActionLanes
+
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_done_after_handled():
+    async def run():
+        release = asyncio.Event()
+        handled = []
+
+        async def handle(action):
+            await release.wait()
+            handled.append(action["n"])
+
+        lanes = ActionLanes(handle, asyncio.get_running_loop(), idle_timeout=0.05)
+        done = asyncio.get_running_loop().create_future()
+        lanes.submit({"guild_id": 1, "n": 0}, done)
+
+        await settle()
+        assert not done.done()
+        release.set()
+        assert await asyncio.wait_for(done, 1) is True
+        assert handled == [0]
+        assert not lanes.in_flight
+
+    asyncio.run(run())
+
+
+def test_done_after_failed():
+    async def run():
+        async def handle(action):
+            raise ValueError("bad action")
+
+        lanes = ActionLanes(handle, asyncio.get_running_loop(), idle_timeout=0.05)
+        done = asyncio.get_running_loop().create_future()
+        lanes.submit({"guild_id": 1}, done)
+
+        assert await asyncio.wait_for(done, 1) is True
+
+    asyncio.run(run())
+
+
+def test_busy_guild_is_turned_away():
+    async def run():
+        loop = asyncio.get_running_loop()
+        release = asyncio.Event()
+        handled = []
+
+        async def handle(action):
+            if action["guild_id"] == 1:
+                await release.wait()
+            handled.append((action["guild_id"], action["n"]))
+
+        lanes = ActionLanes(handle, loop, idle_timeout=0.05, max_in_flight=2)
+        done = [loop.create_future() for _ in range(3)]
+        for n, future in enumerate(done):
+            lanes.submit({"guild_id": 1, "n": n}, future)
+        await settle()
+
+        # Over the guild's share, the consumer requeues it
+        assert done[2].result() is False
+        assert not done[0].done() and not done[1].done()
+
+        other = loop.create_future()
+        lanes.submit({"guild_id": 2, "n": 0}, other)
+        assert await asyncio.wait_for(other, 1) is True
+        assert handled == [(2, 0)]
+
+        release.set()
+        assert await asyncio.wait_for(asyncio.gather(done[0], done[1]), 1) == [True, True]
+        assert handled[1:] == [(1, 0), (1, 1)]
+        assert not lanes.in_flight
+
+        # With room again it's taken
+        retry = loop.create_future()
+        lanes.submit({"guild_id": 1, "n": 2}, retry)
+        assert await asyncio.wait_for(retry, 1) is True
+
+    asyncio.run(run())
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from src.transcription.audio import SAMPLING_RATE, pcm_to_float32
+
+
+def pcm(*frames):
+    return np.array(frames, dtype=np.int16).tobytes()
+
+
+def test_downmixes_and_scales():
+    audio = pcm_to_float32(pcm(16384, -16384, 32767, 32767, -32768, 0), SAMPLING_RATE, 2)
+
+    assert audio.dtype == np.float32
+    assert audio.tolist() == pytest.approx([0, 32767 / 32768, -0.5])
+
+
+def test_ignores_a_partial_frame():
+    # One stereo frame and a dangling sample and byte
+    assert len(pcm_to_float32(pcm(1, 1, 1) + b"\x01", SAMPLING_RATE, 2)) == 1
+
+
+def test_averages_integer_factors():
+    samples = np.repeat(np.arange(4, dtype=np.int16) * 1024, 3)
+    audio = pcm_to_float32(samples.tobytes(), 48000, 1)
+
+    assert audio.tolist() == pytest.approx([0, 1 / 32, 2 / 32, 3 / 32])
+
+
+def test_interpolates_other_rates():
+    samples = (np.arange(22050) % 100).astype(np.int16)
+    audio = pcm_to_float32(samples.tobytes(), 22050, 1)
+
+    assert audio.dtype == np.float32
+    assert len(audio) == SAMPLING_RATE
+    assert audio[0] == 0
@@ -0,0 +1,67 @@
+from src.music.audio_cache import PCM_BYTES_PER_SECOND, AudioCache, RecordingAudio
+
+FRAME = b"\x01" * 3840
+
+
+class FrameSource:
+    def __init__(self, frames):
+        self.frames = frames
+        self.cleaned_up = False
+
+    def read(self):
+        return FRAME if self.frames and self.frames.pop() else b""
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+def play(source):
+    while source.read():
+        pass
+    source.cleanup()
+
+
+def test_record_caches_played_clip(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    source = cache.record("clip", FrameSource([True] * 5))
+    assert isinstance(source, RecordingAudio)
+    # Played by someone else at the same time, it's only cached once
+    assert isinstance(cache.record("clip", FrameSource([True])), FrameSource)
+
+    play(source)
+
+    cached = cache.get("clip")
+    assert cached is not None
+    assert [cached.read() for _ in range(6)] == [FRAME] * 5 + [b""]
+    assert not cache.in_flight
+
+
+def test_record_skips_stopped_clip(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    source = cache.record("clip", FrameSource([True] * 5))
+
+    source.read()
+    source.cleanup()
+
+    assert cache.get("clip") is None
+    assert list(tmp_path.iterdir()) == []
+    assert not cache.in_flight
+
+
+def test_record_skips_clip_that_ended_early(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    play(cache.record("clip", FrameSource([True] * 5), expected_seconds=10))
+
+    assert cache.get("clip") is None
+
+
+def test_record_truncates_long_clip(tmp_path):
+    cache = AudioCache(str(tmp_path), max_clip_seconds=1)
+    play(cache.record("clip", FrameSource([True] * 100)))
+    assert cache.entries["clip"] == PCM_BYTES_PER_SECOND
+
+    play(cache.record("long tts", FrameSource([True] * 100), truncate=False))
+    assert cache.get("long tts") is None
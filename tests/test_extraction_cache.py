@@ -0,0 +1,60 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.music.extraction_cache import ExtractionCache, normalize_query
+
+
+class FakeYoutubeDL:
+    def __init__(self, release):
+        self.release = release
+        self.calls = 0
+
+    def extract_info(self, query, download=False):
+        self.calls += 1
+        self.release.wait(1)
+        return {"title": query}
+
+
+def test_normalize_query():
+    assert normalize_query("https://www.youtube.com/watch?v=abc&t=1") == "youtube:abc"
+    assert normalize_query("https://youtu.be/abc") == "youtube:abc"
+    assert normalize_query("  Never  Gonna ") == "never gonna"
+
+
+def test_concurrent_lookups_share_one_extraction():
+    release = threading.Event()
+    ytdl = FakeYoutubeDL(release)
+    cache = ExtractionCache(lambda: ytdl, max_workers=1)
+
+    async def run():
+        first = asyncio.create_task(cache.extract_info("https://youtu.be/abc"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.extract_info("https://www.youtube.com/watch?v=abc"))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == [{"title": "https://youtu.be/abc"}] * 2
+    assert ytdl.calls == 1
+    assert cache.get("youtube:abc") == {"title": "https://youtu.be/abc"}
+
+
+def test_cancelled_extraction_releases_waiters():
+    release = threading.Event()
+    cache = ExtractionCache(lambda: FakeYoutubeDL(release), max_workers=1)
+
+    async def run():
+        first = asyncio.create_task(cache.extract_info("song"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(cache.extract_info("song"))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(second, 1)
+        assert "song" not in cache.in_flight
+        release.set()
+
+    asyncio.run(run())
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("supabase")
+
+from src.database.guild_settings import GuildSettingsStore  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeQuery:
+    def __init__(self, client):
+        self.client = client
+        self.guild_ids = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.guild_ids = [value]
+        return self
+
+    def in_(self, column, values):
+        self.guild_ids = values
+        return self
+
+    def execute(self):
+        self.client.queries.append(self.guild_ids)
+        if len(self.client.queries) in self.client.failing:
+            raise ConnectionError("gateway timeout")
+        return FakeResponse([self.client.rows[guild_id] for guild_id in self.guild_ids
+                             if guild_id in self.client.rows])
+
+
+class FakeClient:
+    def __init__(self, rows, failing=()):
+        self.rows = {str(guild_id): row for guild_id, row in rows.items()}
+        # Numbers of the queries that fail, from 1
+        self.failing = failing
+        self.queries = []
+
+    def table(self, name):
+        return FakeQuery(self)
+
+
+def guild_row(guild_id):
+    return {"guild_id": str(guild_id), "voice": "nova"}
+
+
+def test_preload_pages_and_remembers_missing_rows():
+    client = FakeClient({guild_id: guild_row(guild_id) for guild_id in range(0, 250, 2)})
+    store = GuildSettingsStore(client)
+
+    asyncio.run(store.preload(list(range(250)), page_size=100))
+
+    assert [len(query) for query in client.queries] == [100, 100, 50]
+    assert store.rows[2] == guild_row(2)
+    # Known to have no row, not queried again
+    assert 3 in store.rows and store.rows[3] is None
+    assert asyncio.run(store.get(3)) is None
+    assert len(client.queries) == 3
+
+
+def test_preload_goes_on_after_a_failed_page():
+    client = FakeClient({guild_id: guild_row(guild_id) for guild_id in range(250)}, failing=(1,))
+    store = GuildSettingsStore(client)
+
+    asyncio.run(store.preload(list(range(250)), page_size=100))
+
+    assert len(client.queries) == 3
+    assert 0 not in store.rows
+    assert store.rows[100] == guild_row(100)
+    # Loaded on first use instead
+    assert asyncio.run(store.get(0)) == guild_row(0)
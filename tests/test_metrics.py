@@ -0,0 +1,35 @@
+import asyncio
+import logging
+
+from src.utils.metrics import Metrics
+
+
+def test_snapshot():
+    metrics = Metrics()
+    metrics.increment("nickname.sent")
+    metrics.increment("nickname.sent")
+    metrics.set_gauge("actions.lanes", 3)
+    for value in range(101):
+        metrics.observe("tts.gap", value)
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot["counters"] == {"nickname.sent": 2}
+    assert snapshot["gauges"] == {"actions.lanes": 3}
+    assert snapshot["histograms"]["tts.gap"] == {"count": 101, "p50": 50, "p95": 95}
+
+
+def test_log_every(caplog):
+    metrics = Metrics()
+    metrics.increment("transcripts.published")
+
+    async def run():
+        task = asyncio.create_task(metrics.log_every(0.01))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    with caplog.at_level(logging.DEBUG, logger="src.utils.metrics"):
+        asyncio.run(run())
+
+    assert caplog.records
+    assert "'transcripts.published': 1" in caplog.records[0].getMessage()
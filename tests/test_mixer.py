@@ -0,0 +1,26 @@
+from src.music.mixer import MixerSource
+from src.music.tts_stream import FRAME_SIZE, SILENCE_FRAME
+
+
+class FrameSource:
+    def __init__(self, *frames):
+        self.frames = list(frames)
+
+    def read(self):
+        return self.frames.pop(0) if self.frames else b""
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        pass
+
+
+def test_oversized_frame_ends_layer():
+    errors = []
+    mixer = MixerSource()
+    mixer.set_layer("tts", FrameSource(b"\x01" * (FRAME_SIZE * 2)), after=errors.append)
+
+    assert mixer.read() == SILENCE_FRAME
+    assert not mixer.has_layers()
+    assert len(errors) == 1 and isinstance(errors[0], ValueError)
@@ -0,0 +1,103 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import discord
+import pytest
+
+from src.bot import nickname_status
+from src.bot.nickname_status import NicknameStatus
+from src.utils.metrics import Metrics
+
+
+class FakeMember:
+    def __init__(self, nick=None, failures=()):
+        self.nick = nick
+        self.edits = []
+        self.failures = list(failures)
+
+    async def edit(self, nick):
+        self.edits.append((nick, time.monotonic()))
+        if self.failures:
+            raise self.failures.pop(0)
+        self.nick = nick
+
+
+def fake_bot(member):
+    guild = SimpleNamespace(me=member)
+    return SimpleNamespace(get_guild=lambda guild_id: guild)
+
+
+def rate_limited(retry_after):
+    response = SimpleNamespace(status=429, reason="Too Many Requests",
+                               headers={"Retry-After": str(retry_after)})
+    return discord.HTTPException(response, {"message": "You are being rate limited.", "code": 0})
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    metrics = Metrics()
+    monkeypatch.setattr(nickname_status, "metrics", metrics)
+    return lambda: metrics.snapshot()["counters"]
+
+
+def test_coalesces_a_burst(counters):
+    member = FakeMember()
+
+    async def run():
+        status = NicknameStatus(fake_bot(member), 1, debounce=0.01, min_interval=0)
+        for nick in ("Thinking", "Playing", "Billy"):
+            status.set(nick)
+        await status.task
+
+    asyncio.run(run())
+
+    assert [nick for nick, _ in member.edits] == ["Billy"]
+    assert counters() == {"nickname.sent": 1, "nickname.suppressed": 2}
+
+
+def test_suppresses_unchanged_nick(counters):
+    member = FakeMember(nick="Billy")
+
+    async def run():
+        status = NicknameStatus(fake_bot(member), 1, debounce=0, min_interval=0)
+        status.set("Billy")
+        await status.task
+
+    asyncio.run(run())
+
+    assert member.edits == []
+    assert counters() == {"nickname.suppressed": 1}
+
+
+def test_spaces_out_edits(counters):
+    member = FakeMember()
+
+    async def run():
+        status = NicknameStatus(fake_bot(member), 1, debounce=0, min_interval=0.1)
+        status.set("Thinking")
+        await status.task
+        status.set("Billy")
+        await status.task
+
+    asyncio.run(run())
+
+    (_, first), (_, second) = member.edits
+    assert second - first >= 0.1
+    assert counters() == {"nickname.sent": 2}
+
+
+def test_retries_after_rate_limit(counters):
+    member = FakeMember(failures=[rate_limited(0.05)])
+
+    async def run():
+        status = NicknameStatus(fake_bot(member), 1, debounce=0, min_interval=0)
+        status.set("Billy")
+        await asyncio.wait_for(status.task, 1)
+
+    asyncio.run(run())
+
+    (_, first), (_, second) = member.edits
+    assert second - first >= 0.05
+    assert member.nick == "Billy"
+    assert counters() == {"nickname.sent": 1}
@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+import pytest
+
+from src.config.cliargs import CLIArgs
+from src.transcription.models import profile_model
+from src.transcription.scheduler import InferenceScheduler
+
+AUDIO = np.zeros(160, dtype=np.float32)
+
+
+def make_scheduler(**kw):
+    scheduler = InferenceScheduler(linger=0, **kw)
+    scheduler.decoded = []
+
+    def decode(batch):
+        scheduler.decoded.append([(job.guild_id, job.key, job.profile) for job in batch])
+        return [job.key for job in batch]
+
+    scheduler._decode = decode
+    return scheduler
+
+
+def test_guilds_share_a_batch():
+    scheduler = make_scheduler(batch_size=3)
+    for key in "abcd":
+        scheduler.submit(1, key, AUDIO)
+    scheduler.submit(2, "e", AUDIO)
+
+    batch = scheduler._take_batch()
+    assert [(job.guild_id, job.key) for job in batch] == [(1, "a"), (2, "e"), (1, "b")]
+
+    # The rest waits for the next batch
+    assert [job.key for job in scheduler._take_batch()] == ["c", "d"]
+    assert scheduler._take_batch() == []
+
+
+def test_expired_windows_are_dropped():
+    scheduler = make_scheduler()
+    late = scheduler.submit(1, "late", AUDIO, deadline=0)
+    kept = scheduler.submit(1, "kept", AUDIO, deadline=0, expire=False)
+    time.sleep(0.01)
+
+    batch = scheduler._take_batch()
+    assert late.result(0) is None
+    assert [job.key for job in batch] == ["kept"]
+
+
+def test_newer_window_replaces_pending_one():
+    scheduler = make_scheduler()
+    old = scheduler.submit(1, "speaker", AUDIO)
+    new = scheduler.submit(1, "speaker", AUDIO)
+
+    assert old.result(0) is None
+    batch = scheduler._take_batch()
+    assert len(batch) == 1 and batch[0].future is new
+
+
+def test_urgent_final_goes_first():
+    scheduler = make_scheduler()
+    for key in "abc":
+        scheduler.submit(1, key, AUDIO, profile="partial")
+    scheduler.submit(2, "phrase", AUDIO, profile="final", deadline=0, expire=False)
+
+    batch = scheduler._take_batch()
+    assert [(job.key, job.profile) for job in batch] == [("phrase", "final")]
+    assert {job.profile for job in scheduler._take_batch()} == {"partial"}
+
+
+def test_decodes_on_worker():
+    scheduler = make_scheduler()
+    scheduler.start()
+    try:
+        assert scheduler.submit(1, "a", AUDIO).result(1) == "a"
+    finally:
+        scheduler.stop()
+
+    assert scheduler.decoded == [[(1, "a", "partial")]]
+
+
+def test_only_wake_profile_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(CLIArgs, "wake_model", "None")
+    monkeypatch.setattr(CLIArgs, "partial_model", "None")
+
+    assert profile_model("wake") is None
+    with pytest.raises(ValueError):
+        profile_model("partial")
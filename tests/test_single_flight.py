@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from src.utils.single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_load():
+    flights = SingleFlight()
+    loads = []
+
+    async def load():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return "row"
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", load) for _ in range(3)))
+
+    assert asyncio.run(run()) == ["row"] * 3
+    assert loads == [1]
+    assert "key" not in flights
+
+
+def test_waiters_get_the_exception():
+    flights = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(0.01)
+        raise ConnectionError("down")
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", load) for _ in range(2)), return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert isinstance(first, ConnectionError) and second is first
+
+
+def test_cancelled_load_cancels_waiters():
+    flights = SingleFlight()
+
+    async def load():
+        await asyncio.sleep(10)
+
+    async def run():
+        first = asyncio.create_task(flights.do("key", load))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flights.do("key", load))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await asyncio.wait_for(second, 1)
+        assert "key" not in flights
+
+    asyncio.run(run())
+
+
+def test_forget_starts_a_new_load():
+    flights = SingleFlight()
+    results = iter(["old", "new"])
+
+    async def load():
+        result = next(results)
+        await asyncio.sleep(0.01)
+        return result
+
+    async def run():
+        first = asyncio.create_task(flights.do("key", load))
+        await asyncio.sleep(0)
+        flights.forget("key")
+        second = asyncio.create_task(flights.do("key", load))
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(run()) == ["old", "new"]
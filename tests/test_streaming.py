@@ -0,0 +1,59 @@
+import pytest
+
+from src.transcription.streaming import LocalAgreement, Word
+
+
+def words(*spans):
+    return [Word(start, end, text) for start, end, text in spans]
+
+
+def test_commits_the_agreed_prefix():
+    stream = LocalAgreement(min_tail=1.0, max_window=10.0)
+
+    assert stream.update(words((0, 0.5, " Hey"), (0.5, 1.0, " Billy"), (1.0, 1.5, " play")), 5.0) == 0
+    assert stream.committed == []
+
+    # Case and punctuation don't break agreement, the third word changed
+    cut = stream.update(words((0, 0.5, " hey"), (0.5, 1.0, " Billy,"), (1.0, 1.5, " pause")), 5.0)
+    assert cut == 1.0
+    assert stream.committed == [" hey", " Billy,"]
+    assert stream.text() == "hey Billy, pause"
+
+
+def test_rebases_the_tail_after_a_cut():
+    stream = LocalAgreement(min_tail=1.0, max_window=10.0)
+    stream.update(words((0, 0.5, " Hey"), (0.5, 1.0, " Billy"), (1.2, 1.8, " play")), 5.0)
+    stream.update(words((0, 0.5, " Hey"), (0.5, 1.0, " Billy"), (1.2, 1.8, " pause")), 5.0)
+
+    assert stream.hypothesis == [Word(pytest.approx(0.2), pytest.approx(0.8), " pause")]
+
+    # The next window starts at the cut, its words agree with the rebased tail
+    assert stream.update(words((0.2, 0.8, " pause"), (0.8, 1.2, " jazz")), 4.0) == 0.8
+    assert stream.committed == [" Hey", " Billy", " pause"]
+
+
+def test_keeps_the_min_tail():
+    stream = LocalAgreement(min_tail=1.0, max_window=10.0)
+    hypothesis = words((0, 0.5, " Hey"), (0.5, 1.0, " Billy"), (1.0, 1.8, " play"))
+    stream.update(hypothesis, 2.5)
+
+    # " play" agrees but ends within the last second of the window
+    assert stream.update(hypothesis, 2.5) == 1.0
+    assert stream.committed == [" Hey", " Billy"]
+    assert [word.text for word in stream.hypothesis] == [" play"]
+
+
+def test_forces_a_commit_past_max_window():
+    stream = LocalAgreement(min_tail=1.0, max_window=10.0)
+
+    # No earlier hypothesis to agree with
+    cut = stream.update(words((0, 5.0, " blah"), (5.0, 10.5, " blah"), (10.5, 11.5, " blah")), 12.0)
+    assert cut == 10.5
+    assert stream.committed == [" blah", " blah"]
+
+
+def test_drops_a_long_window_without_words():
+    stream = LocalAgreement(min_tail=1.0, max_window=10.0)
+
+    assert stream.update([], 12.0) == 11.0
+    assert stream.update([], 5.0) == 0
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aio_pika")
+
+from src.queue.transcript_publisher import TranscriptPublisher  # noqa: E402
+
+
+class FakeExchange:
+    def __init__(self, published, delay):
+        self.published = published
+        self.delay = delay
+
+    async def publish(self, message, routing_key):
+        await asyncio.sleep(self.delay)
+        self.published.append(message.body)
+
+
+class FakeChannel:
+    def __init__(self, published, delay):
+        self.default_exchange = FakeExchange(published, delay)
+        self.closed = False
+
+    async def declare_queue(self, name):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, delay=0.01):
+        self.published = []
+        self.delay = delay
+
+    async def channel(self, publisher_confirms=False):
+        return FakeChannel(self.published, self.delay)
+
+
+def test_close_publishes_pending():
+    async def run():
+        connection = FakeConnection()
+        publisher = TranscriptPublisher(connection, batch_size=2)
+        await publisher.setup_connection()
+        for n in range(5):
+            await publisher.publish_data({"n": n})
+
+        await publisher.close()
+        return connection.published, publisher.channels
+
+    published, channels = asyncio.run(run())
+    assert sorted(published) == [b'{"n":%d}' % n for n in range(5)]
+    assert all(channel.closed for channel in channels)
+
+
+def test_close_gives_up_after_timeout():
+    async def run():
+        connection = FakeConnection(delay=10)
+        publisher = TranscriptPublisher(connection)
+        await publisher.setup_connection()
+        await publisher.publish_data({"n": 0})
+
+        await publisher.close(timeout=0.05)
+        return connection.published, publisher.publish_task
+
+    published, task = asyncio.run(run())
+    assert published == []
+    assert task.cancelled()
@@ -0,0 +1,63 @@
+import asyncio
+
+from src.music.tts_queue import TTSQueue
+
+
+class FakeSource:
+    def __init__(self):
+        self.cleaned_up = False
+
+    def read(self):
+        return b""
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+class FakeBot:
+    def __init__(self, loop):
+        self.loop = loop
+
+
+class FakeHelper:
+    def __init__(self, loop):
+        self.bot = FakeBot(loop)
+        self.mixer = None
+        self.current_music_source = None
+
+
+def test_close_cleans_up_queued_clips():
+    async def run():
+        loop = asyncio.get_running_loop()
+        queue = TTSQueue(None, FakeHelper(loop))
+        # Not started, so the clips stay queued
+        queue.player_task = loop.create_future()
+
+        queued = FakeSource()
+        loaded = FakeSource()
+        loading = loop.create_future()
+
+        async def load(source):
+            return source
+
+        async def load_forever():
+            await loading
+            return FakeSource()
+
+        await queue.add_tts(queued)
+        await queue.add_tts(load(loaded))
+        await queue.add_tts(load_forever())
+        await asyncio.sleep(0)
+
+        queue.close()
+        await asyncio.sleep(0)
+
+        assert queued.cleaned_up
+        assert loaded.cleaned_up
+        assert loading.cancelled()
+        assert queue.tts_sources.empty()
+
+    asyncio.run(run())
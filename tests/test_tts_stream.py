@@ -0,0 +1,92 @@
+import struct
+
+from src.music.tts_stream import FRAME_SIZE, SILENCE_FRAME, TTSStream, TTSStreams
+
+
+def ogg_page(packet, pagenum, flag=0):
+    """A single packet Ogg page, without a valid CRC (discord doesn't check it)."""
+    segments = [255] * (len(packet) // 255) + [len(packet) % 255]
+    header = struct.pack("<BBQIIIB", 0, flag, 0, 1, pagenum, 0, len(segments))
+    return b"OggS" + header + bytes(segments) + packet
+
+
+def opus_stream(*packets):
+    opus_head = b"OpusHead" + struct.pack("<BBHIhB", 1, 2, 312, 48000, 0, 0)
+    opus_tags = b"OpusTags" + struct.pack("<I", 4) + b"test" + struct.pack("<I", 0)
+    pages = [ogg_page(opus_head, 0, flag=2), ogg_page(opus_tags, 1)]
+    pages += [ogg_page(packet, 2 + i) for i, packet in enumerate(packets)]
+    return b"".join(pages)
+
+
+class FakeDecoder:
+    """Decodes every packet to 60 ms of audio, the byte value being its first byte."""
+
+    def __init__(self):
+        self.packets = []
+
+    def decode(self, packet):
+        self.packets.append(packet)
+        return bytes([packet[0]]) * (FRAME_SIZE * 3)
+
+
+def read_all(stream):
+    frames = []
+    while frame := stream.read():
+        frames.append(frame)
+    return frames
+
+
+def test_opus_passthrough_skips_headers():
+    stream = TTSStream("s", format="opus", max_stall=0.1)
+    stream.feed(0, opus_stream(b"\x01audio", b"\x02audio"), final=True)
+
+    assert read_all(stream) == [b"\x01audio", b"\x02audio"]
+
+
+def test_opus_decoded_in_frames():
+    stream = TTSStream("s", format="opus", max_stall=0.1, passthrough=False)
+    stream.decoder = decoder = FakeDecoder()
+    stream.feed(0, opus_stream(b"\x01audio", b"\x02audio"), final=True)
+
+    frames = read_all(stream)
+
+    assert decoder.packets == [b"\x01audio", b"\x02audio"]
+    assert frames == [b"\x01" * FRAME_SIZE] * 3 + [b"\x02" * FRAME_SIZE] * 3
+
+
+def test_opus_decoded_pads_last_frame():
+    stream = TTSStream("s", format="opus", max_stall=0.1, passthrough=False)
+    stream.decoder = FakeDecoder()
+    stream.decoder.decode = lambda packet: b"\x01" * (FRAME_SIZE + 10)
+    stream.feed(0, opus_stream(b"\x01audio"), final=True)
+
+    frames = read_all(stream)
+
+    assert frames == [b"\x01" * FRAME_SIZE, b"\x01" * 10 + SILENCE_FRAME[10:]]
+
+
+def test_opus_cut_short_ends_stream():
+    stream = TTSStream("s", format="opus", max_stall=0.1)
+    data = opus_stream(b"\x01audio", b"\x02audio")
+    stream.feed(0, data[:-3])
+
+    assert read_all(stream) == [b"\x01audio"]
+
+
+def test_final_chunk_before_others():
+    streams = TTSStreams()
+
+    stream, created = streams.open("s", max_stall=0.1)
+    streams.feed(stream, 0, b"\x01" * FRAME_SIZE)
+    assert created
+
+    stream, created = streams.open("s", max_stall=0.1)
+    streams.feed(stream, 2, b"\x03" * FRAME_SIZE, final=True)
+    assert not created
+
+    stream, created = streams.open("s", max_stall=0.1)
+    streams.feed(stream, 1, b"\x02" * FRAME_SIZE)
+    assert not created
+    assert "s" not in streams.streams
+
+    assert read_all(stream) == [bytes([n]) * FRAME_SIZE for n in (1, 2, 3)]
@@ -0,0 +1,49 @@
+import numpy as np
+
+from src.transcription.audio import SAMPLING_RATE
+from src.transcription.vad import FRAME_SAMPLES, StreamingVAD
+
+
+def tone(seconds, amplitude):
+    t = np.arange(int(seconds * SAMPLING_RATE)) / SAMPLING_RATE
+    return (amplitude * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def test_energy_gate():
+    vad = StreamingVAD(silero_threshold=None)
+
+    assert not vad.is_speech(np.zeros(0, dtype=np.float32))
+    assert not vad.is_speech(np.zeros(FRAME_SAMPLES * 5, dtype=np.float32))
+    assert vad.is_speech(tone(0.1, 0.3))
+    # Shorter than a frame is padded
+    assert vad.is_speech(tone(0.005, 0.3))
+
+
+def test_follows_the_noise_floor():
+    vad = StreamingVAD(silero_threshold=None, energy_margin_db=10, min_energy_db=-60)
+    hum = tone(0.1, 0.01)  # about -43 dB
+
+    # Over the initial floor
+    assert vad.is_speech(hum)
+
+    # A room at about -52 dB raises the floor, the hum is no longer speech
+    for _ in range(50):
+        assert not vad.is_speech(tone(0.1, 0.0035))
+    assert vad.noise_floor_db > -53
+    assert not vad.is_speech(hum)
+    assert vad.is_speech(tone(0.1, 0.3))
+
+
+def test_keeps_context():
+    vad = StreamingVAD(silero_threshold=None, context=0.3)
+    for _ in range(5):
+        vad.is_speech(tone(0.1, 0.3))
+
+    assert len(vad.context) == int(0.3 * SAMPLING_RATE)
+
+
+def test_silero_rejects_tones():
+    vad = StreamingVAD()
+
+    # Loud enough for the energy gate, but nothing like a voice
+    assert not vad.is_speech(tone(0.5, 0.3))
@@ -0,0 +1,173 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.bot.sinks import whisper_sink
+from src.bot.sinks.speech_decoder import SkipDecoder, SpeechDecoder
+from src.bot.sinks.whisper_sink import Speaker, WhisperSink
+from src.transcription.streaming import LocalAgreement, Word
+
+
+def make_sink(**kwargs):
+    return WhisperSink(None, None, scheduler=object(), **kwargs)
+
+
+def fake_voice_client(ssrc_map):
+    decoder = SimpleNamespace(SAMPLING_RATE=48000, CHANNELS=2, SAMPLE_SIZE=4)
+    return SimpleNamespace(
+        decoder=decoder,
+        ws=SimpleNamespace(ssrc_map=ssrc_map),
+        channel=SimpleNamespace(guild=SimpleNamespace(id=0)),
+    )
+
+
+class FakeSpeechDecoder:
+    """SpeechDecoder without libopus."""
+
+    SAMPLING_RATE = SpeechDecoder.SAMPLING_RATE
+    CHANNELS = SpeechDecoder.CHANNELS
+    SAMPLE_SIZE = SpeechDecoder.SAMPLE_SIZE
+
+    def __init__(self, on_decoded):
+        self.on_decoded = on_decoded
+
+
+def speech_sink(monkeypatch, ssrc_map, **kwargs):
+    monkeypatch.setattr(whisper_sink, "SpeechDecoder", FakeSpeechDecoder)
+
+    sink = make_sink(decode_for_speech=True, **kwargs)
+    vc = fake_voice_client(ssrc_map)
+    sink.init(vc)
+    return sink, vc
+
+
+def talking_speaker(sink, last_word, last_speech):
+    speaker = Speaker(1, None, None)
+    speaker.phrase = "Hey Billy, play some jazz"
+    speaker.word_timeout = sink.quiet_phrase_timeout * sink.mid_sentence_multiplier
+    speaker.last_word = last_word
+    speaker.last_speech = last_speech
+    speaker.last_phrase = last_word
+    return speaker
+
+
+def test_commit_cuts_the_window():
+    sink = make_sink()
+    sink.init(fake_voice_client({}))
+    speaker = Speaker(1, LocalAgreement(min_tail=1.0), None)
+    # Two seconds of 48 kHz stereo, every 10 ms of audio has its own byte value
+    chunk = 48000 * 4 // 100
+    speaker.data = [b"".join(bytes([n]) * chunk for n in range(200))]
+
+    hypothesis = [Word(0, 0.25, " Hey"), Word(0.25, 0.505, " Billy"), Word(0.6, 1.5, " play")]
+    assert sink.commit_transcription(speaker, hypothesis) == "Hey Billy play"
+    assert len(speaker.data[0]) == 2 * 48000 * 4
+
+    assert sink.commit_transcription(speaker, hypothesis) == "Hey Billy play"
+    # 0.505 s is 24240 frames of 4 bytes, the cut lands mid 10 ms chunk
+    assert len(speaker.data[0]) == (96000 - 24240) * 4
+    assert speaker.data[0][:1] == bytes([50])
+    assert speaker.data[0][-1:] == bytes([199])
+
+
+def test_word_timeout_decays_without_speech():
+    sink = make_sink(quiet_phrase_timeout=0.5, mid_sentence_multiplier=1.2, no_data_multiplier=0.55)
+    speaker = talking_speaker(sink, last_word=100.0, last_speech=100.0)
+
+    assert sink.word_timeout(speaker, 100.05) == pytest.approx(0.6)
+    assert sink.word_timeout(speaker, 100.15) == pytest.approx(0.33)
+    assert sink.word_timeout(speaker, 100.25) == pytest.approx(0.1815)
+    # Polling every 100 ms ended the phrase on the first tick past 0.2 s
+    assert sink.word_deadline(speaker) == pytest.approx(100.2)
+
+
+def test_word_deadline_within_an_interval():
+    sink = make_sink(quiet_phrase_timeout=0.5, mid_sentence_multiplier=1.2, no_data_multiplier=0.55)
+    # Speech kept coming in after the words stopped changing
+    speaker = talking_speaker(sink, last_word=100.0, last_speech=100.5)
+
+    assert sink.word_deadline(speaker) == pytest.approx(100.6)
+
+
+def test_word_deadline_without_decay():
+    sink = make_sink(no_data_multiplier=1)
+    speaker = talking_speaker(sink, last_word=100.0, last_speech=100.0)
+
+    assert sink.word_deadline(speaker) == pytest.approx(100.0 + speaker.word_timeout)
+
+
+def test_phrase_finalized_at_decayed_timeout(monkeypatch):
+    sink = make_sink(quiet_phrase_timeout=0.5, mid_sentence_multiplier=1.2, no_data_multiplier=0.55)
+    speaker = talking_speaker(sink, last_word=100.0, last_speech=100.0)
+    sink.speakers[speaker.user] = speaker
+    finalized = []
+    monkeypatch.setattr(sink, "finalize", finalized.append)
+
+    monkeypatch.setattr("time.time", lambda: 100.19)
+    sink.check_speaker_timeouts()
+    assert finalized == []
+
+    monkeypatch.setattr("time.time", lambda: 100.21)
+    sink.check_speaker_timeouts()
+    assert finalized == [speaker]
+    assert not sink.speakers
+
+
+def test_speech_decoder_replaces_lookup(monkeypatch):
+    sink, vc = speech_sink(monkeypatch, {})
+
+    assert vc.decoder.get_decoder == sink.get_decoder
+    assert (sink.sampling_rate, sink.channels, sink.sample_size) == (16000, 1, 2)
+
+
+def test_speakers_over_the_limit_get_no_decoder(monkeypatch):
+    sink, _ = speech_sink(monkeypatch, {1: {"user_id": 10}, 2: {"user_id": 20}}, max_speakers=0)
+
+    decoder = sink.get_decoder(1)
+    assert isinstance(decoder, FakeSpeechDecoder)
+    assert sink.get_decoder(1) is decoder
+    sink.speakers[10] = Speaker(10, None, None)
+
+    # No slot left, the packets aren't decoded and the decoder isn't kept
+    assert isinstance(sink.get_decoder(2), SkipDecoder)
+    assert 2 not in sink.decoders
+
+    sink.write(b"\x01" * 640, 20)
+    assert sink.pending_packets == []
+
+
+def test_decoders_pruned_with_their_speaker(monkeypatch):
+    sink, _ = speech_sink(monkeypatch, {1: {"user_id": 10}, 2: {"user_id": 20}})
+    sink.get_decoder(1)
+    sink.get_decoder(2)
+    speaker = Speaker(10, None, None)
+    sink.speakers[10] = speaker
+
+    sink.remove_speaker(speaker)
+
+    assert list(sink.decoders) == [2]
+    assert not sink.speakers
+
+
+def test_write_rescales_silence(monkeypatch):
+    sink, _ = speech_sink(monkeypatch, {})
+    pcm = b"\x01\x02" * 320
+
+    # 20 ms at 16 kHz mono was decoded, the voice client padded 60 ms of
+    # 48 kHz stereo silence before it
+    sink.last_decoded_length = len(pcm)
+    sink.write(bytes(11520) + pcm, 10)
+
+    (user, data), = sink.pending_packets
+    assert user == 10
+    assert data == bytes(1920) + pcm
+
+
+def test_write_without_silence(monkeypatch):
+    sink, _ = speech_sink(monkeypatch, {})
+    pcm = b"\x01\x02" * 320
+
+    sink.last_decoded_length = len(pcm)
+    sink.write(pcm, 10)
+
+    assert sink.pending_packets == [(10, pcm)]
@@ -0,0 +1,45 @@
+import time
+
+import pytest
+
+pytest.importorskip("yt_dlp")
+
+from src.music.ytdl_source import YTDLOpusSource  # noqa: E402
+
+
+class FakeOpus:
+    def __init__(self, volume):
+        self.volume = volume
+        self.cleaned_up = False
+
+    def prefetch(self):
+        pass
+
+    def read(self):
+        return b"packet"
+
+    def cleanup(self):
+        self.cleaned_up = True
+
+
+def test_volume_changes_restart_once(monkeypatch):
+    spawned = []
+
+    def spawn(self, volume, position):
+        spawned.append(volume)
+        return FakeOpus(volume)
+
+    monkeypatch.setattr(YTDLOpusSource, "_spawn", spawn)
+    monkeypatch.setattr(YTDLOpusSource, "VOLUME_DEBOUNCE", 0.05)
+
+    source = YTDLOpusSource({"url": "https://example.com/stream"}, volume=0.5)
+    for volume in (0.6, 0.7, 0.8):
+        source.volume = volume
+
+    deadline = time.monotonic() + 1
+    while source.original.volume != 0.8 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    # The two overtaken changes never started an ffmpeg
+    assert spawned == [0.5, 0.8]
+    assert source.original.volume == 0.8